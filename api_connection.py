@@ -1,7 +1,16 @@
 # Import necessary libraries
 import os
+import json
+import time
+import random
+import threading
 import requests
 import logging
+from email.utils import parsedate_to_datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from metrics import metrics
 from dotenv import load_dotenv
 
 # Function to set up logging
@@ -29,8 +38,8 @@ logger = setup_logging()
 # Log a message indicating that logging setup is complete
 logger.info("Logging setup complete.")
 
-# Load environment variables from a .env file
-load_dotenv()
+# Load environment variables from a .env file, or from the file named by ENV_FILE
+load_dotenv(os.getenv('ENV_FILE'))
 # Get the values of the environment variables and set them as strings so they can be used in the script
 client_id = os.getenv('CLIENT_ID')
 client_secret = os.getenv('CLIENT_SECRET')
@@ -38,6 +47,17 @@ cert_path = os.getenv("CERT_PATH")
 base_url = os.getenv('BASE_URL')
 # Construct the authentication URL using the base URL string
 auth_url = f"{base_url}oauth/token"
+# Client-side request rate (requests per second) and how many times a throttled or failed request is retried
+rate_limit = float(os.getenv('RATE_LIMIT', '10'))
+max_retries = int(os.getenv('MAX_RETRIES', '5'))
+# Optional file used to reuse a still-valid access token across runs, and how early (seconds) to refresh before expiry
+token_cache_file = os.getenv('TOKEN_CACHE_FILE')
+token_refresh_margin = int(os.getenv('TOKEN_REFRESH_MARGIN', '60'))
+# Lifetime (seconds) assumed for a token whose response has no expires_in; a token revoked sooner is caught by the 401 retry
+default_token_lifetime = 300
+# Page size for list endpoints and how many further pages are fetched in parallel once X-Total-Count is known
+page_size = int(os.getenv('PAGE_SIZE', '250'))
+page_prefetch = int(os.getenv('PAGE_PREFETCH', '4'))
 
 # Function to check if all required environment variables are set
 if not all([client_id, client_secret, cert_path, base_url]):
@@ -46,8 +66,8 @@ if not all([client_id, client_secret, cert_path, base_url]):
     # Raise an error to stop the program
     raise EnvironmentError("Missing one or more required environment variables.")
 
-# Function to get an access token from the API
-def get_access_token():
+# Function to request a new token from the API, returning the full token response
+def request_access_token(session=None):
     # Data to be sent in the POST request to get the access token
     data = {
         'grant_type': 'client_credentials',
@@ -55,14 +75,16 @@ def get_access_token():
         'client_secret': client_secret,
     }
     try:
-        # Send a POST request to the authentication URL with the data
-        response = requests.post(auth_url, data=data, verify=cert_path)
+        # Use the shared session when one is given so the token call reuses its connections
+        http = session or requests
+        # Send a POST request to the authentication URL with the data, overriding any JSON content type set on the session
+        response = http.post(auth_url, data=data, headers={'Content-Type': 'application/x-www-form-urlencoded'}, verify=cert_path)
         # Check if the request was successful (status code 200)
         if response.status_code == 200:
             # Log a success message
             logger.info("Successfully obtained access token.")
-            # Return the access token from the response
-            return response.json().get('access_token')
+            # Return the token response, which includes the access token and its lifetime
+            return response.json()
         else:
             # Log an error message if the request failed
             logger.error(f"Failed to obtain access token. Status code: {response.status_code}")
@@ -73,10 +95,16 @@ def get_access_token():
         logger.error(f"Exception occurred while obtaining access token: {e}")
         return None
 
+# Function to get an access token from the API, optionally through an existing session
+def get_access_token(session=None):
+    token_response = request_access_token(session)
+    # Return the access token from the response
+    return token_response.get('access_token') if token_response else None
+
 # Function to create the API connection headers, which contain the access token
-def get_api_connection():
+def get_api_connection(session=None):
     # Get the access token
-    access_token = get_access_token()
+    access_token = get_access_token(session)
     # Check if the access token was obtained successfully
     if access_token:
         # Create the headers for the API connection
@@ -93,4 +121,325 @@ def get_api_connection():
         # Log an error message if the access token was not obtained
         logger.error("Failed to obtain access token.")
         # Raise an error to indicate the failure
-        raise ConnectionError("Failed to obtain access token.")
\ No newline at end of file
+        raise ConnectionError("Failed to obtain access token.")
+
+# Class that keeps a bearer token valid for the whole run and refreshes it shortly before it expires
+class TokenProvider:
+    def __init__(self, session=None, cache_file=token_cache_file, refresh_margin=token_refresh_margin):
+        self.session = session
+        self.cache_file = cache_file
+        self.refresh_margin = refresh_margin
+        self.access_token = None
+        # Wall-clock expiry so a cached token can be checked by a later run
+        self.expires_at = 0.0
+        # Only one worker refreshes the token at a time
+        self.lock = threading.Lock()
+        self.load_cached_token()
+
+    # Function to load a token saved by an earlier run for the same tenant and client
+    def load_cached_token(self):
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, 'r') as f:
+                cached = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable token cache {self.cache_file}. Error: {e}")
+            return
+        if cached.get('base_url') == base_url and cached.get('client_id') == client_id:
+            self.access_token = cached.get('access_token')
+            self.expires_at = float(cached.get('expires_at', 0))
+            if not self.needs_refresh():
+                logger.info(f"Loaded cached access token from {self.cache_file}.")
+
+    # Function to save the current token so later runs can skip the oauth/token call
+    def save_cached_token(self):
+        if not self.cache_file:
+            return
+        cached = {
+            'base_url': base_url,
+            'client_id': client_id,
+            'access_token': self.access_token,
+            'expires_at': self.expires_at,
+        }
+        try:
+            # The file holds a live credential, so only the current user may read it
+            fd = os.open(self.cache_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(cached, f)
+        except OSError as e:
+            logger.warning(f"Failed to write token cache {self.cache_file}. Error: {e}")
+
+    # Function to check whether the token is missing or about to expire
+    def needs_refresh(self):
+        return not self.access_token or time.time() >= self.expires_at - self.refresh_margin
+
+    # Function to return a valid access token, refreshing it first if needed
+    def get_token(self):
+        if not self.needs_refresh():
+            return self.access_token
+        with self.lock:
+            # Another worker may have refreshed the token while this one waited for the lock
+            if self.needs_refresh():
+                with metrics.timer('api_request_seconds', endpoint='oauth_token'):
+                    token_response = request_access_token(self.session)
+                metrics.increment('token_refreshes_total')
+                if not token_response or not token_response.get('access_token'):
+                    # Raise an error to indicate the failure
+                    raise ConnectionError("Failed to obtain access token.")
+                self.access_token = token_response['access_token']
+                expires_in = float(token_response.get('expires_in') or default_token_lifetime)
+                self.expires_at = time.time() + expires_in
+                logger.info(f"Access token refreshed, valid for {expires_in:.0f} seconds.")
+                self.save_cached_token()
+            return self.access_token
+
+    # Function to drop a token the API rejected, unless another worker already replaced it
+    def invalidate(self, access_token):
+        with self.lock:
+            if self.access_token == access_token:
+                self.expires_at = 0.0
+
+# Function to work out how long to wait from a Retry-After header (seconds or HTTP date)
+def parse_retry_after(value, default):
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+# Function to compute a jittered exponential backoff delay for a retry attempt
+def backoff_delay(attempt, base=0.5, cap=30.0):
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+# Class implementing an adaptive token bucket shared by every worker
+class RateLimiter:
+    def __init__(self, rate, min_rate=0.5):
+        # The configured rate is the ceiling; the current rate drops when the tenant throttles us
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        # The bucket holds one second's worth of tokens, but never less than the one token a request needs
+        self.tokens = self.capacity()
+        self.updated = time.monotonic()
+        # No tokens are handed out before this time after a 429
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    # Function to return the bucket size; below 1 request/second it still holds one full token
+    def capacity(self):
+        return max(1.0, self.rate)
+
+    # Function to block until a request may be sent
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now >= self.blocked_until:
+                    # Refill the bucket for the time that has passed since the last update
+                    self.tokens = min(self.capacity(), self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                else:
+                    wait = self.blocked_until - now
+            time.sleep(wait)
+
+    # Function to pause and halve the rate when the tenant answers with 429
+    def on_throttled(self, retry_after):
+        with self.lock:
+            now = time.monotonic()
+            # Workers throttled in the same window only lower the rate once
+            if now >= self.blocked_until:
+                self.rate = max(self.min_rate, self.rate / 2)
+                logger.warning(f"Throttled by tenant, lowering request rate to {self.rate:.2f} requests/second.")
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+            self.tokens = 0
+            self.updated = self.blocked_until
+
+    # Function to slowly raise the rate back towards the configured limit after successful requests
+    def on_success(self):
+        with self.lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * 0.01)
+
+# Class that owns one pooled, keep-alive HTTP session shared by every API call
+class ApiClient:
+    def __init__(self, pool_size=10, rate=rate_limit, retries=max_retries):
+        # Create a session so TLS connections are kept alive and reused between requests
+        self.session = requests.Session()
+        # Share one rate limiter across every worker that uses this client
+        self.rate_limiter = RateLimiter(rate)
+        self.max_retries = retries
+        # Size the connection pool to match the number of concurrent workers
+        self.set_pool_size(pool_size)
+        # Set the cert bundle once instead of passing it on every request
+        self.session.verify = cert_path
+        # Set the JSON headers once; the bearer token is added per request so it can be refreshed mid-run
+        self.session.headers.update({
+            'Content-Type': 'application/json',
+            'Accept': 'application/json',
+        })
+        self.token_provider = TokenProvider(self.session)
+        # Fetch (or load) the token up front so a bad configuration fails before any work starts
+        self.token_provider.get_token()
+        # Log a success message
+        logger.info(f"Created pooled API client with pool size {pool_size}.")
+
+    # Function to resize the connection pool, e.g. when the number of workers changes
+    # pool_size is the number of threads that call the client; paginate prefetches pages on one shared executor of the same size
+    def set_pool_size(self, pool_size):
+        previous_executor = getattr(self, 'page_executor', None)
+        self.page_executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='page-prefetch')
+        if previous_executor is not None:
+            previous_executor.shutdown(wait=False)
+        # Each caller and each prefetch thread uses at most one connection at a time, so no connection is ever discarded
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size * 2)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    # Function to send a rate-limited request, retrying on 429, 5xx and connection errors
+    # The endpoint name labels the request in the run metrics
+    def request(self, method, url, endpoint='other', **kwargs):
+        headers = kwargs.pop('headers', None) or {}
+        attempt = 0
+        token_refreshed = False
+        while True:
+            access_token = self.token_provider.get_token()
+            self.rate_limiter.acquire()
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, headers={**headers, 'Authorization': f"Bearer {access_token}"}, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                metrics.observe('api_request_seconds', time.perf_counter() - start, endpoint=endpoint)
+                metrics.increment('api_requests_total', endpoint=endpoint, status='connection_error')
+                # Give up and let the caller handle the exception once the retries are used up
+                if attempt >= self.max_retries:
+                    raise
+                metrics.increment('api_retries_total', endpoint=endpoint, reason='connection_error')
+                delay = backoff_delay(attempt)
+                logger.warning(f"Connection error for {url}, retrying in {delay:.2f}s (attempt {attempt + 1}/{self.max_retries}). Error: {e}")
+                time.sleep(delay)
+                attempt += 1
+                continue
+            metrics.observe('api_request_seconds', time.perf_counter() - start, endpoint=endpoint)
+            metrics.increment('api_requests_total', endpoint=endpoint, status=str(response.status_code))
+
+            if response.status_code == 401 and not token_refreshed:
+                # The token was revoked or expired early; refresh it once and resend
+                logger.warning(f"Unauthorized response on {url}, refreshing access token.")
+                self.token_provider.invalidate(access_token)
+                metrics.increment('api_retries_total', endpoint=endpoint, reason='unauthorized')
+                token_refreshed = True
+                continue
+
+            if response.status_code == 429 and attempt < self.max_retries:
+                # Honour Retry-After; the rate limiter holds back every worker until it has passed
+                retry_after = parse_retry_after(response.headers.get('Retry-After'), backoff_delay(attempt))
+                logger.warning(f"Rate limited on {url}, retrying in {retry_after:.2f}s (attempt {attempt + 1}/{self.max_retries}).")
+                self.rate_limiter.on_throttled(retry_after)
+                metrics.increment('api_throttled_total', endpoint=endpoint)
+                metrics.increment('api_retries_total', endpoint=endpoint, reason='throttled')
+                attempt += 1
+                continue
+
+            if response.status_code >= 500 and attempt < self.max_retries:
+                delay = backoff_delay(attempt)
+                logger.warning(f"Server error {response.status_code} on {url}, retrying in {delay:.2f}s (attempt {attempt + 1}/{self.max_retries}).")
+                metrics.increment('api_retries_total', endpoint=endpoint, reason='server_error')
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            if response.status_code < 400:
+                self.rate_limiter.on_success()
+            # Any remaining status is returned so the caller can log it as before
+            return response
+
+    # Function to send a GET request through the shared session
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    # Function to send a POST request through the shared session
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    # Function to fetch one page of a list endpoint, raising an HTTPError if it fails
+    def get_page(self, url, params, limit, offset, count=False, endpoint='other'):
+        page_params = {**params, 'limit': limit, 'offset': offset}
+        if count:
+            page_params['count'] = 'true'
+        response = self.get(url, params=page_params, endpoint=endpoint)
+        if response.status_code != 200:
+            # Log the response content so the failure can be diagnosed, then let the caller decide what to do
+            logger.error(f"Failed to retrieve page at offset {offset} from {url}. Status code: {response.status_code}")
+            logger.error(f"Response content: {response.text}")
+            raise requests.exceptions.HTTPError(f"Status code {response.status_code} for {url}", response=response)
+        return response
+
+    # Function to stream every record of a paginated list endpoint, prefetching pages in parallel
+    # The tenant may cap pages below the requested limit, so offsets advance by the records actually returned
+    def paginate(self, url, params=None, limit=page_size, prefetch=page_prefetch, endpoint='other'):
+        params = dict(params or {})
+        # Ask for the total on the first page so the remaining pages can be fetched in parallel
+        response = self.get_page(url, params, limit, 0, count=True, endpoint=endpoint)
+        page = response.json()
+        yield from page
+        # A page larger than the limit means the endpoint ignores paging
+        if not page or len(page) > limit:
+            return
+
+        total_count = response.headers.get('X-Total-Count')
+        if total_count is None:
+            # Without a total, a short first page may only mean the tenant caps pages, so walk the pages one at a time
+            # until one comes back shorter than the first, or empty
+            first_page_length = len(page)
+            offset = len(page)
+            while len(page) == first_page_length:
+                page = self.get_page(url, params, limit, offset, endpoint=endpoint).json()
+                yield from page
+                offset += len(page)
+            return
+
+        # Function to read the records between two offsets one page at a time, stopping early if they run out
+        def read_range(start, end):
+            offset = start
+            while offset < end:
+                page = self.get_page(url, params, min(limit, end - offset), offset, endpoint=endpoint).json()
+                if not page:
+                    return
+                yield from page
+                offset += len(page)
+
+        # The first page shows how many records the tenant returns per page; the rest are requested at that size
+        total = int(total_count)
+        step = len(page)
+        offsets = deque(range(step, total, step))
+        if not offsets:
+            return
+        # Keep at most `prefetch` pages in flight so a slow consumer doesn't hold every page in memory
+        # Pages run on the client's shared executor, which bounds the prefetches of every concurrent paginate call together
+        in_flight = deque()
+        try:
+            while offsets or in_flight:
+                while offsets and len(in_flight) < prefetch:
+                    offset = offsets.popleft()
+                    in_flight.append((offset, self.page_executor.submit(self.get_page, url, params, step, offset, endpoint=endpoint)))
+                # Pages are yielded in offset order as they arrive
+                offset, future = in_flight.popleft()
+                page = future.result().json()
+                yield from page
+                # A page shorter than expected leaves a gap before the next offset, which is read one page at a time
+                end = min(offset + step, total)
+                if offset + len(page) < end:
+                    yield from read_range(offset + len(page), end)
+        finally:
+            for _, future in in_flight:
+                future.cancel()
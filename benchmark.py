@@ -0,0 +1,206 @@
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import resource
+import tempfile
+import subprocess
+import urllib.request
+
+# Directory holding main.py, export.py and mock_server.py
+repo_dir = os.path.dirname(os.path.abspath(__file__))
+# Prefix of the line a child run prints its result on, so it can be told apart from main.py's own output
+result_prefix = "BENCHMARK_RESULT "
+# Metrics compared against a baseline; each one regresses when it grows past the tolerance
+regression_metrics = ["wall_seconds", "api_calls_per_identity", "peak_rss_mb", "export_seconds"]
+
+# Function to pick a free local port for the mock server
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+# Function to call one of the mock server's control endpoints
+def server_request(base_url, path, method="GET"):
+    request = urllib.request.Request(f"{base_url}{path.lstrip('/')}", method=method, data=b"" if method == "POST" else None)
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.loads(response.read())
+
+# Function to wait until the mock server answers
+def wait_for_server(base_url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            return server_request(base_url, "__stats")
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Mock server at {base_url} did not start within {timeout} seconds.")
+
+# Function to write a synthetic reorg.csv and the settings for one run into its working directory
+def prepare_run_dir(run_dir, size, base_url, args):
+    with open(os.path.join(run_dir, 'reorg.csv'), 'w') as f:
+        f.write("payrollID,firstName,lastName,currentDepartmentID,newDepartment ID,currentTeamID,newTeamID,locationID\n")
+        for i in range(size):
+            f.write(f"P{i:06d},First{i},Last{i},D{i % 40},D{(i + 1) % 40},T{i % 200},T{(i + 7) % 200},L{i % 5}\n")
+    # CERT_PATH is required but never used against the plain-HTTP mock server
+    cert_path = os.path.join(run_dir, 'unused-cert.pem')
+    open(cert_path, 'w').close()
+    settings = {
+        'CLIENT_ID': 'benchmark',
+        'CLIENT_SECRET': 'benchmark',
+        'BASE_URL': base_url,
+        'CERT_PATH': cert_path,
+        'MAX_WORKERS': str(args.workers),
+        'RATE_LIMIT': str(args.rate_limit),
+        'HYDRATION_ENGINE': args.engine,
+        'OUTPUT_FORMAT': args.output_format,
+        'CACHE_FILE': os.path.join(run_dir, 'cache', 'responses.sqlite'),
+        'CHECKPOINT_FILE': os.path.join(run_dir, 'checkpoints', 'reorg_checkpoint.ndjson'),
+        'TOKEN_CACHE_FILE': '',
+    }
+    env_file = os.path.join(run_dir, '.env')
+    with open(env_file, 'w') as f:
+        for name, value in settings.items():
+            f.write(f"{name}={value}\n")
+    # The settings are also passed in the environment so a real .env or shell variables can never point a run at a live tenant
+    return dict(os.environ, ENV_FILE=env_file, **settings)
+
+# Function run inside the child process: hydrate and export the synthetic reorg and print the measurements
+def run_child(args):
+    sys.path.insert(0, repo_dir)
+    import main
+
+    # Wrap the export so its time can be reported separately from hydration
+    export_timing = {}
+    original_export_data = main.export_data
+    def timed_export_data(identities, **kwargs):
+        start = time.perf_counter()
+        original_export_data(identities, **kwargs)
+        export_timing['seconds'] = time.perf_counter() - start
+    main.export_data = timed_export_data
+
+    start = time.perf_counter()
+    main.process_reorg_csv(max_workers=args.workers, use_cache=False, output_format=args.output_format, engine=args.engine)
+    wall_seconds = time.perf_counter() - start
+
+    with open('reports/all_identities_entitlements.csv') as f:
+        export_rows = sum(1 for _ in f) - 1
+    export_seconds = export_timing.get('seconds', 0.0)
+    print(result_prefix + json.dumps({
+        "wall_seconds": wall_seconds,
+        "export_seconds": export_seconds,
+        "export_rows": export_rows,
+        "export_rows_per_second": export_rows / export_seconds if export_seconds else 0.0,
+        # ru_maxrss is reported in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }), flush=True)
+
+# Function to benchmark one reorg size against a fresh mock server
+def run_size(size, args):
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}/"
+    server = subprocess.Popen([
+        sys.executable, os.path.join(repo_dir, 'mock_server.py'),
+        '--port', str(port),
+        '--identities', str(size),
+        '--latency', str(args.latency),
+        '--max-page', str(args.max_page),
+        '--throttle-rate', str(args.throttle_rate),
+        '--retry-after', str(args.retry_after),
+    ], stdout=subprocess.DEVNULL)
+    run_dir = tempfile.mkdtemp(prefix=f"reorg-benchmark-{size}-")
+    try:
+        wait_for_server(base_url)
+        env = prepare_run_dir(run_dir, size, base_url, args)
+        child = subprocess.run([
+            sys.executable, os.path.abspath(__file__), '--child',
+            '--workers', str(args.workers),
+            '--engine', args.engine,
+            '--output-format', args.output_format,
+        ], cwd=run_dir, env=env, capture_output=True, text=True)
+        result_lines = [line for line in child.stdout.splitlines() if line.startswith(result_prefix)]
+        if child.returncode != 0 or not result_lines:
+            raise RuntimeError(f"Benchmark run for {size} identities failed:\n{child.stdout}\n{child.stderr}")
+        result = json.loads(result_lines[-1][len(result_prefix):])
+        stats = server_request(base_url, "__stats")
+    finally:
+        server.terminate()
+        server.wait()
+        if args.keep:
+            print(f"Kept working directory {run_dir}")
+        else:
+            shutil.rmtree(run_dir, ignore_errors=True)
+
+    # Token requests and injected 429s are reported separately from the API calls the pipeline makes
+    api_calls = sum(count for endpoint, count in stats.items() if endpoint not in ("oauth_token", "throttled"))
+    result.update({
+        "identities": size,
+        "identities_per_second": size / result["wall_seconds"] if result["wall_seconds"] else 0.0,
+        "api_calls": api_calls,
+        "api_calls_per_identity": api_calls / size if size else 0.0,
+        "throttled": stats.get("throttled", 0),
+        "token_requests": stats.get("oauth_token", 0),
+        "calls_by_endpoint": stats,
+    })
+    return result
+
+# Function to compare results with a baseline file, returning a description of every regression
+def find_regressions(results, baseline_file, tolerance):
+    with open(baseline_file) as f:
+        baseline = {entry["identities"]: entry for entry in json.load(f)["results"]}
+    regressions = []
+    for result in results:
+        previous = baseline.get(result["identities"])
+        if not previous:
+            continue
+        for metric in regression_metrics:
+            if previous.get(metric) and result[metric] > previous[metric] * (1 + tolerance):
+                regressions.append(f"{result['identities']} identities: {metric} {result[metric]:.2f} vs baseline {previous[metric]:.2f}")
+    return regressions
+
+# Function to print the results as a table
+def print_results(results):
+    print(f"{'identities':>10} {'wall s':>9} {'ident/s':>9} {'calls/ident':>11} {'429s':>6} {'peak RSS MB':>11} {'export s':>9} {'export rows/s':>13}")
+    for result in results:
+        print(f"{result['identities']:>10} {result['wall_seconds']:>9.2f} {result['identities_per_second']:>9.1f} {result['api_calls_per_identity']:>11.2f} {result['throttled']:>6} {result['peak_rss_mb']:>11.1f} {result['export_seconds']:>9.2f} {result['export_rows_per_second']:>13.0f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark process_reorg_csv and export_data against a local mock IdentityNow tenant.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000], help="Reorg sizes to benchmark (default: 100 1000 10000)")
+    parser.add_argument('--workers', type=int, default=8, help="Concurrent workers (default: 8)")
+    parser.add_argument('--engine', choices=['rest', 'search'], default='rest', help="Hydration engine (default: rest)")
+    parser.add_argument('--output-format', choices=['json', 'ndjson'], default='ndjson', help="Identities output format (default: ndjson)")
+    parser.add_argument('--rate-limit', type=float, default=1000, help="Client RATE_LIMIT in requests/second (default: 1000)")
+    parser.add_argument('--latency', type=float, default=0.01, help="Mock server latency per request in seconds (default: 0.01)")
+    parser.add_argument('--max-page', type=int, default=250, help="Largest page the mock server returns (default: 250)")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="Fraction of requests the mock server answers with 429 (default: 0)")
+    parser.add_argument('--retry-after', type=int, default=1, help="Retry-After seconds for injected 429s (default: 1)")
+    parser.add_argument('--output', default='benchmark_results.json', help="File the results are written to (default: benchmark_results.json)")
+    parser.add_argument('--baseline', help="Earlier results file to compare against; exits non-zero on regressions")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed growth over the baseline before a metric counts as a regression (default: 0.2)")
+    parser.add_argument('--keep', action='store_true', help="Keep each run's working directory")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        sys.exit(0)
+
+    results = []
+    for size in args.sizes:
+        print(f"Benchmarking {size} identities...", flush=True)
+        results.append(run_size(size, args))
+    print_results(results)
+    with open(args.output, 'w') as f:
+        json.dump({"settings": {key: value for key, value in vars(args).items() if key not in ("child", "keep")}, "results": results}, f, indent=4)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        regressions = find_regressions(results, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            sys.exit(1)
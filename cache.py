@@ -0,0 +1,169 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import logging
+from dotenv import load_dotenv
+from metrics import metrics
+
+# Function to set up logging
+def setup_logging():
+    if not os.path.exists('logs'):
+        os.makedirs('logs')
+    logger = logging.getLogger('cache')
+    logger.setLevel(logging.INFO)
+    handler = logging.FileHandler('logs/cache.log')
+    formatter = logging.Formatter('%(asctime)s - %(message)s')
+    handler.setFormatter(formatter)
+    logger.addHandler(handler)
+    return logger
+
+# Set up logging
+logger = setup_logging()
+logger.info("Logging setup complete.")
+
+# Load environment variables from a .env file, or from the file named by ENV_FILE
+load_dotenv(os.getenv('ENV_FILE'), override=True)
+cache_file = os.getenv('CACHE_FILE', 'cache/responses.sqlite')
+cache_max_bytes = int(os.getenv('CACHE_MAX_MB', '256')) * 1024 * 1024
+# Bump when the shape of cached values changes; a cache written with another version is cleared on open
+cache_schema_version = 2
+
+# Default time-to-live in seconds for each cached endpoint, overridable with CACHE_TTL_<ENDPOINT>
+default_ttls = {
+    'identity_alias': 6 * 60 * 60,
+    'role_details': 24 * 60 * 60,
+    'entitlements': 6 * 60 * 60,
+}
+
+# Class implementing a persistent SQLite response cache shared across runs
+class ResponseCache:
+    def __init__(self, path=cache_file, ttls=None, max_bytes=cache_max_bytes, enabled=True):
+        self.path = path
+        self.ttls = dict(default_ttls)
+        for endpoint in self.ttls:
+            env_ttl = os.getenv(f"CACHE_TTL_{endpoint.upper()}")
+            if env_ttl:
+                self.ttls[endpoint] = int(env_ttl)
+        self.ttls.update(ttls or {})
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = {}
+        self.misses = {}
+        # One connection is shared by every worker, so access is serialised with a lock
+        self.lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                endpoint TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (endpoint, key)
+            )
+        """)
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        if self.connection.execute("PRAGMA user_version").fetchone()[0] != cache_schema_version:
+            logger.info(f"Clearing {path}: cached values were written by a different cache schema version.")
+            self.connection.execute("DELETE FROM responses")
+            self.connection.execute(f"PRAGMA user_version = {cache_schema_version}")
+        self.connection.commit()
+        self.total_bytes = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    # Function to record a hit or miss for an endpoint
+    def count(self, counters, endpoint):
+        counters[endpoint] = counters.get(endpoint, 0) + 1
+        metrics.increment('cache_lookups_total', endpoint=endpoint, result='hit' if counters is self.hits else 'miss')
+
+    # Function to return a cached value, or None if it is missing, expired or the cache is bypassed
+    def get(self, endpoint, key):
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute("SELECT value, size, created_at FROM responses WHERE endpoint = ? AND key = ?", (endpoint, str(key))).fetchone()
+            if row is None:
+                self.count(self.misses, endpoint)
+                return None
+            value, size, created_at = row
+            if now - created_at > self.ttls.get(endpoint, 0):
+                # Expired entries are dropped as soon as they are seen
+                self.connection.execute("DELETE FROM responses WHERE endpoint = ? AND key = ?", (endpoint, str(key)))
+                self.connection.commit()
+                self.total_bytes -= size
+                self.count(self.misses, endpoint)
+                return None
+            self.connection.execute("UPDATE responses SET accessed_at = ? WHERE endpoint = ? AND key = ?", (now, endpoint, str(key)))
+            self.connection.commit()
+            self.count(self.hits, endpoint)
+        return json.loads(value)
+
+    # Function to store a value, evicting the least recently used entries when the cache is over its size limit
+    def set(self, endpoint, key, value):
+        if not self.enabled:
+            return
+        now = time.time()
+        serialized = json.dumps(value)
+        size = len(serialized)
+        with self.lock:
+            previous = self.connection.execute("SELECT size FROM responses WHERE endpoint = ? AND key = ?", (endpoint, str(key))).fetchone()
+            if previous:
+                self.total_bytes -= previous[0]
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (endpoint, key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (endpoint, str(key), serialized, size, now, now)
+            )
+            self.total_bytes += size
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+            self.connection.commit()
+
+    # Function to delete least recently used entries until the cache is back under 90% of its size limit
+    def evict(self):
+        target_bytes = int(self.max_bytes * 0.9)
+        evicted = 0
+        for endpoint, key, size in self.connection.execute("SELECT endpoint, key, size FROM responses ORDER BY accessed_at").fetchall():
+            if self.total_bytes <= target_bytes:
+                break
+            self.connection.execute("DELETE FROM responses WHERE endpoint = ? AND key = ?", (endpoint, key))
+            self.total_bytes -= size
+            evicted += 1
+        logger.info(f"Evicted {evicted} entries from {self.path}; cache size is now {self.total_bytes} bytes.")
+
+    # Function to invalidate every entry, or only the entries for one endpoint
+    def clear(self, endpoint=None):
+        with self.lock:
+            if endpoint:
+                self.connection.execute("DELETE FROM responses WHERE endpoint = ?", (endpoint,))
+            else:
+                self.connection.execute("DELETE FROM responses")
+            self.connection.commit()
+            self.total_bytes = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        logger.info(f"Cleared {endpoint or 'all'} entries from {self.path}.")
+
+    # Function to return hit and miss counts for each endpoint
+    def stats(self):
+        endpoints = sorted(set(self.hits) | set(self.misses))
+        return {endpoint: {"hits": self.hits.get(endpoint, 0), "misses": self.misses.get(endpoint, 0)} for endpoint in endpoints}
+
+    # Function to publish the hit ratio of each endpoint as a gauge
+    def record_hit_ratios(self):
+        for endpoint, counts in self.stats().items():
+            lookups = counts['hits'] + counts['misses']
+            metrics.set_gauge('cache_hit_ratio', counts['hits'] / lookups if lookups else 0.0, endpoint=endpoint)
+
+    # Function to log and return a one-line summary of cache hits and misses
+    def summary(self):
+        if not self.enabled:
+            return "Response cache bypassed."
+        parts = [f"{endpoint}: {counts['hits']} hits / {counts['misses']} misses" for endpoint, counts in self.stats().items()]
+        summary = f"Response cache ({self.path}): " + (", ".join(parts) if parts else "no lookups")
+        logger.info(summary)
+        return summary
@@ -0,0 +1,94 @@
+import os
+import json
+import threading
+import logging
+from dotenv import load_dotenv
+
+# Function to set up logging
+def setup_logging():
+    if not os.path.exists('logs'):
+        os.makedirs('logs')
+    logger = logging.getLogger('checkpoint')
+    logger.setLevel(logging.INFO)
+    handler = logging.FileHandler('logs/checkpoint.log')
+    formatter = logging.Formatter('%(asctime)s - %(message)s')
+    handler.setFormatter(formatter)
+    logger.addHandler(handler)
+    return logger
+
+# Set up logging
+logger = setup_logging()
+logger.info("Logging setup complete.")
+
+# Load environment variables from a .env file, or from the file named by ENV_FILE
+load_dotenv(os.getenv('ENV_FILE'), override=True)
+checkpoint_file = os.getenv('CHECKPOINT_FILE', 'checkpoints/reorg_checkpoint.ndjson')
+
+# Class implementing an append-only log of hydrated identities, one JSON record per line
+class CheckpointLog:
+    def __init__(self, path=checkpoint_file, resume=False):
+        self.path = path
+        self.lock = threading.Lock()
+        # Byte offset of the latest record for each payroll ID, used to read identities back in CSV order
+        self.offsets = {}
+        # Number of identities appended by this run, not counting those found on resume
+        self.appended = 0
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        if resume and os.path.exists(path):
+            self.scan()
+            logger.info(f"Resuming from {path} with {len(self.offsets)} completed identities.")
+        else:
+            # A fresh run starts with an empty log
+            open(path, 'w').close()
+        self.file = open(path, 'ab')
+
+    # Function to index the records already in the log, dropping a partial last line left by a crash
+    def scan(self):
+        valid_end = 0
+        with open(self.path, 'rb') as f:
+            offset = 0
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                self.offsets[record['payroll_id']] = offset
+                offset += len(line)
+                valid_end = offset
+        if valid_end != os.path.getsize(self.path):
+            logger.warning(f"Truncating incomplete record at byte {valid_end} of {self.path}.")
+            with open(self.path, 'r+b') as f:
+                f.truncate(valid_end)
+
+    # Function to check whether a payroll ID was already completed
+    def is_completed(self, payroll_id):
+        return payroll_id in self.offsets
+
+    # Function to durably append one hydrated identity as soon as it is complete
+    def append(self, payroll_id, identity):
+        line = (json.dumps({"payroll_id": payroll_id, "identity": identity}) + "\n").encode('utf-8')
+        with self.lock:
+            offset = self.file.tell()
+            self.file.write(line)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.offsets[payroll_id] = offset
+            self.appended += 1
+
+    # Function to stream identities back from the log in the given payroll ID order
+    def iter_identities(self, payroll_ids):
+        with open(self.path, 'rb') as f:
+            for payroll_id in payroll_ids:
+                offset = self.offsets.get(payroll_id)
+                if offset is None:
+                    continue
+                f.seek(offset)
+                yield json.loads(f.readline())['identity']
+
+    # Function to close the log file
+    def close(self):
+        self.file.close()
@@ -0,0 +1,85 @@
+# Registry mapping each source name to the function that normalizes its raw entitlements
+normalizers = {}
+
+# Function to register a normalizer for one or more source names
+def register_normalizer(*source_names):
+    def decorator(normalizer):
+        for source_name in source_names:
+            normalizers[source_name] = normalizer
+        return normalizer
+    return decorator
+
+# Function to build the canonical entitlement record shared by main and export
+def make_entitlement(name, value, description, attribute):
+    return {
+        "name": name,
+        "value": value,
+        "description": description,
+        "attribute": attribute,
+    }
+
+# Function to extract CN value
+def extract_cn(value):
+    if value.startswith("CN="):
+        return value.split(",")[0][3:]
+    return value
+
+# Function to get the display name of an entitlement that has no source attributes (e.g. a search access item)
+def get_display_name(entitlement, default=""):
+    return entitlement.get("displayName") or entitlement.get("name") or default
+
+@register_normalizer("Azure Active Directory")
+def normalize_azure_ad(entitlement):
+    attributes = entitlement.get("attributes") or {}
+    if entitlement.get("attribute") == "appRoleAssignments":
+        return make_entitlement(
+            attributes.get("displayName") or get_display_name(entitlement, "No displayName"),
+            entitlement.get("value"),
+            attributes.get("appRole_description") or entitlement.get("description") or "No description",
+            "AppRoleAssignment"
+        )
+    elif entitlement.get("attribute") == "azureADEligibleRoles":
+        return make_entitlement(attributes.get("roleName") or get_display_name(entitlement), entitlement.get("value"), entitlement.get("description") or "", "azureADEligibleRoles")
+    # Other Azure AD attributes are not reported
+    return None
+
+@register_normalizer("Oracle | Multi Applications")
+def normalize_oracle_multi_applications(entitlement):
+    if entitlement.get("attribute") == "APP_ROLE_CODE":
+        attributes = entitlement.get("attributes") or {}
+        return make_entitlement(attributes.get("APP_ROLE_NAME") or get_display_name(entitlement), entitlement.get("value"), entitlement.get("description") or "", "APP_ROLE_CODE")
+    return None
+
+@register_normalizer("Active Directory | Production", "Active Directory")
+def normalize_active_directory(entitlement):
+    # AD group values are DNs; the CN is the name roles refer to
+    return make_entitlement(extract_cn(entitlement["value"]), entitlement["value"], entitlement.get("description", "no description"), entitlement.get("attribute"))
+
+@register_normalizer("Oracle | Legacy Accounts")
+def normalize_oracle_legacy_accounts(entitlement):
+    return make_entitlement(entitlement["value"], entitlement["value"], entitlement.get("description", "no description"), entitlement.get("attribute"))
+
+# Function used for any source without a registered normalizer
+def normalize_default(entitlement):
+    return make_entitlement(entitlement.get("name") or entitlement["value"], entitlement["value"], entitlement.get("description", "no description"), entitlement.get("attribute"))
+
+# Function to normalize a raw entitlement for its source, returning None for entitlements that are not reported
+def normalize_entitlement(source_name, entitlement):
+    return normalizers.get(source_name, normalize_default)(entitlement)
+
+# Function to upgrade an entitlement saved to an identities file or checkpoint log into the canonical record
+# Files written before entitlements were normalized hold the old per-source shapes, which have no "name"
+def upgrade_saved_entitlement(source_name, entitlement):
+    if "name" in entitlement:
+        return entitlement
+    attribute = entitlement.get("attribute")
+    if attribute == "AppRoleAssignment":
+        return make_entitlement(entitlement.get("displayName", "No displayName"), entitlement.get("value"), entitlement.get("appRole_description", "No description"), attribute)
+    elif attribute == "azureADEligibleRoles":
+        return make_entitlement(entitlement.get("roleName", ""), entitlement.get("value"), entitlement.get("description", ""), attribute)
+    elif attribute == "APP_ROLE_CODE":
+        return make_entitlement(entitlement.get("APP_ROLE_NAME", ""), entitlement.get("value"), entitlement.get("description", ""), attribute)
+    elif "value" in entitlement:
+        # The old value/description shape is still a raw entitlement as far as the source normalizers are concerned
+        return normalize_entitlement(source_name, entitlement)
+    raise ValueError(f"Unrecognised saved entitlement for source {source_name}: {entitlement}")
@@ -1,8 +1,21 @@
 import os
 import csv
 import json
+import argparse
 import logging
-import pandas as pd
+from dotenv import load_dotenv
+from openpyxl import Workbook
+from metrics import metrics
+from records import IdentityRecord
+
+# Parquet output is optional, so pyarrow is only needed when it is enabled
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+parquet_supported = pq is not None
 
 # Function to set up logging
 def setup_logging():
@@ -20,118 +33,205 @@ def setup_logging():
 logger = setup_logging()
 logger.info("Logging setup complete.")
 
-# Load identities from JSON file
+# Load environment variables from a .env file, or from the file named by ENV_FILE
+load_dotenv(os.getenv('ENV_FILE'), override=True)
+excel_file = "reports/reorg_entitlements_roles.xlsx"
+# Write a columnar Parquet file next to each CSV report when enabled
+export_parquet = os.getenv('EXPORT_PARQUET', 'false').lower() == 'true'
+# Excel's row limit per sheet; longer reports continue on a numbered sheet
+excel_max_rows = 1048576
+entitlements_header = ["identityName", "sourceName", "entitlementValue", "description", "part of role"]
+roles_header = ["roleName", "entitlementName", "identities"]
+
+# Class that writes each report row once to its CSV, a write-only workbook sheet and optionally Parquet
+class ReportWriter:
+    def __init__(self, name, header, workbook=None, parquet=False, parquet_batch_size=10000):
+        # Check for pyarrow before any file is opened, so a missing dependency never truncates an existing report
+        if parquet and not parquet_supported:
+            logger.error("Parquet output requested but pyarrow is not installed.")
+            raise ImportError("pyarrow is required for Parquet output.")
+        if not os.path.exists('reports'):
+            os.makedirs('reports')
+        self.name = name
+        self.header = header
+        self.csv_file = f"reports/{name}.csv"
+        self.file = open(self.csv_file, mode='w', newline='')
+        self.csv_writer = csv.writer(self.file)
+        self.csv_writer.writerow(header)
+        self.rows = 0
+
+        # Write-only sheets stream rows to disk instead of keeping every cell in memory
+        self.workbook = workbook
+        self.sheet = None
+        self.sheet_rows = 0
+        self.sheet_count = 0
+        if workbook is not None:
+            self.add_sheet()
+
+        # Parquet rows are buffered and written in record batches
+        self.parquet_file = None
+        self.parquet_writer = None
+        self.parquet_batch = []
+        self.parquet_batch_size = parquet_batch_size
+        if parquet:
+            self.parquet_file = f"reports/{name}.parquet"
+            self.parquet_schema = pa.schema([(column, pa.string()) for column in header])
+            self.parquet_writer = pq.ParquetWriter(self.parquet_file, self.parquet_schema)
+
+    # Function to start a new sheet, numbering it once a report overflows Excel's row limit
+    def add_sheet(self):
+        self.sheet_count += 1
+        title = self.name if self.sheet_count == 1 else f"{self.name[:27]}_{self.sheet_count}"
+        self.sheet = self.workbook.create_sheet(title=title)
+        self.sheet.append(self.header)
+        self.sheet_rows = 1
+
+    # Function to write one row to every enabled output
+    def writerow(self, row):
+        self.csv_writer.writerow(row)
+        self.rows += 1
+        if self.sheet is not None:
+            if self.sheet_rows >= excel_max_rows:
+                self.add_sheet()
+            self.sheet.append(row)
+            self.sheet_rows += 1
+        if self.parquet_writer is not None:
+            self.parquet_batch.append(row)
+            if len(self.parquet_batch) >= self.parquet_batch_size:
+                self.flush_parquet()
+
+    # Function to write the buffered Parquet rows as one record batch
+    def flush_parquet(self):
+        if not self.parquet_batch:
+            return
+        columns = list(zip(*self.parquet_batch))
+        table = pa.table({column: ["" if value is None else str(value) for value in values] for column, values in zip(self.header, columns)}, schema=self.parquet_schema)
+        self.parquet_writer.write_table(table)
+        self.parquet_batch = []
+
+    # Function to close the CSV and Parquet files
+    def close(self):
+        if self.parquet_writer is not None:
+            self.flush_parquet()
+            self.parquet_writer.close()
+            logger.info(f"Exported {self.rows} rows to {self.parquet_file}")
+        self.file.close()
+        logger.info(f"Exported {self.rows} rows to {self.csv_file}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+# Stream identities from an NDJSON (JSON Lines) file, one identity per line
+def iter_identities(ndjson_file):
+    with open(ndjson_file, 'r') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+# Load identities from JSON file; NDJSON files are streamed instead of loaded at once
 def load_identities(json_file):
+    if json_file.endswith(('.ndjson', '.jsonl')):
+        return iter_identities(json_file)
     with open(json_file, 'r') as f:
         return json.load(f)
 
-# Function to extract CN value
-def extract_cn(value):
-    if value.startswith("CN="):
-        return value.split(",")[0][3:]
-    return value
-
-# Function to check if entitlement is part of a role and return the role name
-def get_role_name_for_entitlement(identity, entitlement_name):
-    for role in identity.get('roles', []):
-        entitlements = role.get('details', {}).get('entitlements', [])
-        for entitlement in entitlements:
-            if entitlement['name'] == entitlement_name:
-                return role['name']
-    return ""
-
-# Function to write entitlements to a single CSV
-def write_entitlements_to_csv(identities):
-    if not os.path.exists('reports'):
-        os.makedirs('reports')
-    csv_file = "reports/all_identities_entitlements.csv"
-    with open(csv_file, mode='w', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(["identityName", "sourceName", "entitlementValue", "description", "part of role"])
-
-        for identity in identities:
-            display_name = identity.get('name', 'unknown_identity').replace(" ", "_")
-            for account in identity.get('accounts', []):
-                source_name = account['sourceName']
-                for entitlement in account.get('entitlements', []):
-                    if source_name == "Azure Active Directory":
-                        if entitlement["attribute"] == "AppRoleAssignment":
-                            entitlement_name = entitlement["displayName"]
-                        elif entitlement["attribute"] == "azureADEligibleRoles":
-                            entitlement_name = entitlement["roleName"]
-                    elif source_name == "Oracle | Multi Applications":
-                        entitlement_name = entitlement["APP_ROLE_NAME"]
-                    elif source_name in ["Active Directory | Production", "Active Directory"]:
-                        entitlement_name = extract_cn(entitlement["value"])
-                    elif source_name == "Oracle | Legacy Accounts":
-                        entitlement_name = entitlement["value"]
-                    else:
-                        entitlement_name = entitlement.get("name", entitlement.get("roleName", entitlement.get("value", "")))
-
-                    role_name = get_role_name_for_entitlement(identity, entitlement_name)
-                    part_of_role = role_name if role_name else ""
-
-                    if source_name == "Azure Active Directory":
-                        if entitlement["attribute"] == "AppRoleAssignment":
-                            writer.writerow([display_name, source_name, entitlement["displayName"], entitlement.get("description", ""), part_of_role])
-                        elif entitlement["attribute"] == "azureADEligibleRoles":
-                            writer.writerow([display_name, source_name, entitlement["roleName"], entitlement.get("description", ""), part_of_role])
-                    elif source_name == "Oracle | Multi Applications":
-                        if entitlement["attribute"] == "APP_ROLE_CODE":
-                            writer.writerow([display_name, source_name, entitlement["APP_ROLE_NAME"], entitlement.get("description", ""), part_of_role])
-                    elif source_name in ["Active Directory | Production", "Active Directory"]:
-                        writer.writerow([display_name, source_name, entitlement_name, entitlement.get("description", ""), part_of_role])
-                    elif source_name == "Oracle | Legacy Accounts":
-                        writer.writerow([display_name, source_name, entitlement["value"], entitlement.get("description", ""), part_of_role])
-
-    logger.info(f"Exported all entitlements to {csv_file}")
-
-# Function to write roles to CSV
-def write_roles_to_csv(identities):
-    unique_roles = {}
+# Function to turn identities loaded from a file into compact records; records are passed through unchanged
+# The role details saved on each role are collected into role_table, so each role's details are kept once
+def iter_records(identities, role_table):
     for identity in identities:
-        display_name = identity.get('name', 'unknown_identity')
-        for role in identity.get('roles', []):
-            role_name = role['name']
-            entitlements = role.get('details', {}).get('entitlements', [])
-            for entitlement in entitlements:
-                entitlement_name = entitlement['name']
-                if role_name not in unique_roles:
-                    unique_roles[role_name] = {}
-                if entitlement_name not in unique_roles[role_name]:
-                    unique_roles[role_name][entitlement_name] = set()
-                unique_roles[role_name][entitlement_name].add(display_name)
-
-    if not os.path.exists('reports'):
-        os.makedirs('reports')
-        
-    csv_file = "reports/all_roles_entitlements.csv"
-    with open(csv_file, mode='w', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(["roleName", "entitlementName", "identities"])
+        if isinstance(identity, dict):
+            identity = IdentityRecord.from_dict(identity, role_table)
+        yield identity
+
+# Function to get a role's details from the role table
+def get_role_details(role, role_table=None):
+    return (role_table or {}).get(role.id, {})
+
+# Function to build an entitlement name -> role names index from a set of roles
+def build_entitlement_role_index(roles, role_table=None):
+    role_index = {}
+    for role in roles:
+        for entitlement in get_role_details(role, role_table).get('entitlements', []):
+            role_names = role_index.setdefault(entitlement['name'], [])
+            if role.name not in role_names:
+                role_names.append(role.name)
+    return role_index
+
+# Function to get the entitlement index for an identity's roles, built once and shared by identities with the same roles
+def get_entitlement_role_index(identity, index_cache, role_table=None):
+    role_key = tuple(sorted(role.id for role in identity.roles))
+    if role_key not in index_cache:
+        index_cache[role_key] = build_entitlement_role_index(identity.roles, role_table)
+    return role_key, index_cache[role_key]
+
+# Function to check if entitlement is part of any role and return every matching role name
+def get_role_name_for_entitlement(entitlement_name, role_index):
+    return ", ".join(role_index.get(entitlement_name, []))
+
+# Function to write one identity's entitlements to the entitlements CSV
+# Entitlements are already normalized to name/value/description/attribute records when they are fetched
+def write_identity_entitlements(writer, identity, role_index):
+    display_name = (identity.name or 'unknown_identity').replace(" ", "_")
+    for account in identity.accounts:
+        for entitlement in account.entitlements:
+            part_of_role = get_role_name_for_entitlement(entitlement.name, role_index)
+            writer.writerow([display_name, account.source_name, entitlement.name, entitlement.description, part_of_role])
+
+# Function to export one identity: write its entitlement rows and add it to the role memberships for the role report
+def export_identity(writer, identity, index_cache, role_memberships, role_table=None):
+    role_key, role_index = get_entitlement_role_index(identity, index_cache, role_table)
+    write_identity_entitlements(writer, identity, role_index)
+    role_memberships.setdefault(role_key, set()).add(identity.name or 'unknown_identity')
+
+# Function to expand identities grouped by role set into role -> entitlement -> identities, once per unique role set
+def collect_unique_roles(role_memberships, index_cache):
+    unique_roles = {}
+    for role_key, display_names in role_memberships.items():
+        for entitlement_name, role_names in index_cache[role_key].items():
+            for role_name in role_names:
+                unique_roles.setdefault(role_name, {}).setdefault(entitlement_name, set()).update(display_names)
+    return unique_roles
+
+# Function to write the collected role memberships to CSV
+def write_unique_roles_to_csv(unique_roles, workbook=None, parquet=False):
+    with ReportWriter("all_roles_entitlements", roles_header, workbook, parquet) as writer:
         for role_name, entitlements in unique_roles.items():
             for entitlement_name, identities in entitlements.items():
                 writer.writerow([role_name, entitlement_name, ", ".join(identities)])
 
-    logger.info(f"Exported all unique roles and entitlements to {csv_file}")
-
-# Function to combine CSV files into an Excel spreadsheet
-def combine_csv_to_excel():
-    excel_file = "reports/reorg_entitlements_roles.xlsx"
-    with pd.ExcelWriter(excel_file) as writer:
-        for csv_file in os.listdir('reports'):
-            if csv_file.endswith('.csv'):
-                df = pd.read_csv(f'reports/{csv_file}')
-                sheet_name = os.path.splitext(csv_file)[0]
-                df.to_excel(writer, sheet_name=sheet_name, index=False)
-    logger.info(f"Combined all CSV files into {excel_file}")
+    logger.info("Exported all unique roles and entitlements.")
 
 # Main function to process identities and export entitlements and roles
 # Renamed from export_entitlements_and_roles to export_data to match import in main.py
-def export_data(identities):
-    write_entitlements_to_csv(identities)
-    write_roles_to_csv(identities)
-    combine_csv_to_excel()
+# Identities may be a list or any iterator (e.g. from iter_identities); they are consumed in a single pass
+# Every row is written once to its CSV and straight into the workbook (and Parquet), so no report is read back
+# Identities may be compact records or dicts loaded from an identities file, which are converted one at a time
+# When given, role_table (role ID -> details, prefetched by main) is used instead of the details saved on each role
+def export_data(identities, parquet=export_parquet, role_table=None):
+    role_table = dict(role_table or {})
+    workbook = Workbook(write_only=True)
+    # Entitlement->role indexes are shared by identities with the same roles; identities are grouped by role set for the role report
+    index_cache = {}
+    role_memberships = {}
+    with metrics.timer('export_stage_seconds', stage='entitlements'):
+        with ReportWriter("all_identities_entitlements", entitlements_header, workbook, parquet) as writer:
+            for identity in iter_records(identities, role_table):
+                export_identity(writer, identity, index_cache, role_memberships, role_table)
+    logger.info("Exported all entitlements.")
+    with metrics.timer('export_stage_seconds', stage='roles'):
+        write_unique_roles_to_csv(collect_unique_roles(role_memberships, index_cache), workbook, parquet)
+    with metrics.timer('export_stage_seconds', stage='workbook'):
+        workbook.save(excel_file)
+    logger.info(f"Wrote all reports to {excel_file}")
 
 if __name__ == "__main__":
-    export_data(load_identities('all_identities.json'))
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Export reports from a saved identities file.")
+    parser.add_argument('identities_file', nargs='?', default='all_identities.json', help="JSON or NDJSON identities file (default: all_identities.json)")
+    parser.add_argument('--parquet', action='store_true', default=export_parquet, help="Also write each report as Parquet (requires pyarrow)")
+    args = parser.parse_args()
+    if args.parquet and not parquet_supported:
+        parser.error("Parquet output (--parquet or EXPORT_PARQUET=true) requires pyarrow, which is not installed.")
+    export_data(load_identities(args.identities_file), parquet=args.parquet)
\ No newline at end of file
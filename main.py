@@ -1,11 +1,21 @@
 import os
 import csv
 import json
+import time
+import argparse
+from types import MappingProxyType
 import requests
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from api_connection import get_api_connection
-from export import export_data  
+from api_connection import ApiClient
+from cache import ResponseCache
+from checkpoint import CheckpointLog
+from metrics import metrics
+from records import IdentityRecord, RoleRef, AccountRecord
+from entitlements import normalize_entitlement
+from search import search_batch_size, search_identity_batch, get_document_field, search_alias_field, map_identity_document
+from export import export_data, export_parquet, parquet_supported, iter_identities
 
 # Function to set up logging
 def setup_logging():
@@ -23,69 +33,108 @@ def setup_logging():
 logger = setup_logging()
 logger.info("Logging setup complete.")
 
-# Load environment variables from a .env file
-load_dotenv(override=True)
+# Load environment variables from a .env file, or from the file named by ENV_FILE
+load_dotenv(os.getenv('ENV_FILE'), override=True)
 cert_path = os.getenv("CERT_PATH")
 base_url = os.getenv('BASE_URL')
 identities_url = f"{base_url}beta/identities"
-headers = get_api_connection()
+# Number of concurrent workers used to hydrate identities and their accounts
+max_workers = int(os.getenv('MAX_WORKERS', '8'))
+# Shared pooled client; identity and account workers can both be in flight, so the pool covers both
+client = ApiClient(pool_size=max_workers * 2)
+# Persistent cross-run cache for alias lookups, role details and entitlements
+response_cache = ResponseCache()
+# Hydration engine: "rest" (per-identity REST calls) or "search" (bulk identity documents from the search API)
+hydration_engine = os.getenv('HYDRATION_ENGINE', 'rest')
+# Output format for the saved identities: "json" (a single indented array) or "ndjson" (one identity per line, written incrementally)
+output_format = os.getenv('OUTPUT_FORMAT', 'json')
+# Number of aliases sent in each "alias in (...)" filter
+alias_batch_size = int(os.getenv('ALIAS_BATCH_SIZE', '50'))
+# Number of role IDs sent in each "id in (...)" filter when prefetching roles
+role_batch_size = int(os.getenv('ROLE_BATCH_SIZE', '50'))
+# Keep the full identity payloads and save them to the identities file, instead of only the fields the export uses
+dump_raw_identities = os.getenv('DUMP_RAW_IDENTITIES', 'false').lower() == 'true'
+# Directory the run metrics are written to, as JSON and in the Prometheus text format
+metrics_dir = os.getenv('METRICS_DIR', 'reports')
 
 # Ensure all required environment variables are set
 if not all([base_url, cert_path]):
     logger.error("Missing one or more required environment variables.")
     raise EnvironmentError("Missing one or more required environment variables.")
 
-# Function to get identity by alias
-def get_identity_by_alias(alias):
-    filters = f"alias eq \"{alias}\""
+# Function to resolve one batch of aliases with an "alias in (...)" filter, paging through the results
+def get_identities_by_alias_batch(aliases):
+    quoted_aliases = ", ".join(f"\"{alias}\"" for alias in aliases)
+    filters = f"alias in ({quoted_aliases})"
     try:
-        response = requests.get(f"{identities_url}?filters={filters}", headers=headers, verify=cert_path)
-        if response.status_code == 200:
-            identities = response.json()
-            if identities:
-                return identities[0]
-            else:
-                logger.info(f"No matching identity found for alias: {alias}")
-                return None
-        else:
-            logger.error(f"Failed to retrieve identities for alias: {alias}. Status code: {response.status_code}")
-            logger.error(f"Response content: {response.text}")
-            return None
+        return list(client.paginate(identities_url, {"filters": filters}, endpoint='alias_lookup'))
     except requests.exceptions.RequestException as e:
-        logger.error(f"Exception occurred while retrieving identities for alias: {alias}. Error: {e}")
-        return None
+        logger.error(f"Exception occurred while retrieving identities for alias batch starting with: {aliases[0]}. Error: {e}")
+        return []
+
+# Function to resolve all aliases up front, returning an alias->identity record map and the aliases that were not found
+# Each payload is projected into a compact record as it arrives, so the full payloads are only kept when dump_raw is set
+def resolve_identities_by_alias(aliases, batch_size=alias_batch_size, max_workers=max_workers, dump_raw=dump_raw_identities):
+    unique_aliases = list(dict.fromkeys(aliases))
+    identity_map = {}
+    # Only aliases that are not in the response cache are sent to the API
+    uncached_aliases = []
+    for alias in unique_aliases:
+        identity = response_cache.get('identity_alias', alias)
+        if identity is not None:
+            identity_map[alias] = IdentityRecord.from_payload(identity, keep_raw=dump_raw)
+        else:
+            uncached_aliases.append(alias)
+
+    batches = [uncached_aliases[i:i + batch_size] for i in range(0, len(uncached_aliases), batch_size)]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for identities in executor.map(get_identities_by_alias_batch, batches):
+            for identity in identities:
+                identity_map[identity.get('alias')] = IdentityRecord.from_payload(identity, keep_raw=dump_raw)
+                response_cache.set('identity_alias', identity.get('alias'), identity)
+
+    missing_aliases = [alias for alias in unique_aliases if alias not in identity_map]
+    for alias in missing_aliases:
+        logger.info(f"No matching identity found for alias: {alias}")
+    logger.info(f"Resolved {len(identity_map)} of {len(unique_aliases)} aliases in {len(batches)} batches.")
+    return identity_map, missing_aliases
+
+# Function to stream role assignments by identity ID
+def iter_role_assignments(identity_id):
+    role_assignments_url = f"{base_url}beta/identities/{identity_id}/role-assignments"
+    for role_assignment in client.paginate(role_assignments_url, endpoint='role_assignments'):
+        yield RoleRef(role_assignment['role']['id'], role_assignment['role']['name'], role_assignment['role'].get('owner', {}).get('name', 'N/A'))
 
 # Function to get role assignments by identity ID
 def get_role_assignments(identity_id):
-    role_assignments_url = f"{base_url}beta/identities/{identity_id}/role-assignments"
     try:
-        response = requests.get(role_assignments_url, headers=headers, verify=cert_path)
-        if response.status_code == 200:
-            role_assignments = response.json()
-            roles = [{"name": role_assignment['role']['name'], "owner": role_assignment['role'].get('owner', {}).get('name', 'N/A'), "entitlements": {}, "id": role_assignment['role']['id']} for role_assignment in role_assignments]
-            return roles
-        else:
-            logger.error(f"Failed to retrieve role assignments for identity ID: {identity_id}. Status code: {response.status_code}")
-            logger.error(f"Response content: {response.text}")
-            return []
+        return list(iter_role_assignments(identity_id))
     except requests.exceptions.RequestException as e:
         logger.error(f"Exception occurred while retrieving role assignments for identity ID: {identity_id}. Error: {e}")
         return []
 
+# Function to parse a role from beta/roles into the role details used by main and export
+def parse_role_details(role_details):
+    entitlements = role_details.get("entitlements", [])
+    parsed_entitlements = [{"id": ent["id"], "name": ent["name"]} for ent in entitlements]
+    return {
+        "name": role_details["name"],
+        "owner": (role_details.get("owner") or {}).get("name", "N/A"),
+        "entitlements": parsed_entitlements
+    }
+
 # Function to get role details by role ID
 def get_role_details(role_id):
+    cached_role_details = response_cache.get('role_details', role_id)
+    if cached_role_details is not None:
+        return cached_role_details
     role_details_url = f"{base_url}beta/roles/{role_id}"
     try:
-        response = requests.get(role_details_url, headers=headers, verify=cert_path)
+        response = client.get(role_details_url, endpoint='role_details')
         if response.status_code == 200:
-            role_details = response.json()
-            entitlements = role_details.get("entitlements", [])
-            parsed_entitlements = [{"id": ent["id"], "name": ent["name"]} for ent in entitlements]
-            return {
-                "name": role_details["name"],
-                "owner": role_details.get("owner", {}).get("name", "N/A"),
-                "entitlements": parsed_entitlements
-            }
+            parsed_role_details = parse_role_details(response.json())
+            response_cache.set('role_details', role_id, parsed_role_details)
+            return parsed_role_details
         else:
             logger.error(f"Failed to retrieve role details for role ID: {role_id}. Status code: {response.status_code}")
             logger.error(f"Response content: {response.text}")
@@ -94,123 +143,258 @@ def get_role_details(role_id):
         logger.error(f"Exception occurred while retrieving role details for role ID: {role_id}. Error: {e}")
         return {}
 
+# Function to stream accounts by identity ID
+def iter_accounts(identity_id):
+    accounts_url = f"{base_url}beta/accounts"
+    yield from client.paginate(accounts_url, {"filters": f"identityId eq \"{identity_id}\""}, endpoint='accounts')
+
 # Function to get accounts by identity ID
 def get_accounts(identity_id):
-    accounts_url = f"{base_url}beta/accounts?filters=identityId eq \"{identity_id}\""
     try:
-        response = requests.get(accounts_url, headers=headers, verify=cert_path)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            logger.error(f"Failed to retrieve accounts for identity ID: {identity_id}. Status code: {response.status_code}")
-            logger.error(f"Response content: {response.text}")
-            return []
+        return list(iter_accounts(identity_id))
     except requests.exceptions.RequestException as e:
         logger.error(f"Exception occurred while retrieving accounts for identity ID: {identity_id}. Error: {e}")
         return []
 
+# Function to stream normalized entitlements by account ID
+def iter_entitlements(account_id, source_name):
+    entitlements_url = f"{base_url}beta/accounts/{account_id}/entitlements"
+    for entitlement in client.paginate(entitlements_url, endpoint='entitlements'):
+        normalized_entitlement = normalize_entitlement(source_name, entitlement)
+        if normalized_entitlement is not None:
+            yield normalized_entitlement
+
 # Function to get entitlements by account ID
 def get_entitlements(account_id, source_name):
-    entitlements_url = f"{base_url}beta/accounts/{account_id}/entitlements"
+    cached_entitlements = response_cache.get('entitlements', account_id)
+    if cached_entitlements is not None:
+        return cached_entitlements
     try:
-        response = requests.get(entitlements_url, headers=headers, verify=cert_path)
-        if response.status_code == 200:
-            entitlements = response.json()
-            parsed_entitlements = []
-            for entitlement in entitlements:
-                if source_name == "Azure Active Directory":
-                    if entitlement["attribute"] == "appRoleAssignments":
-                        parsed_entitlements.append({
-                            "attribute": "AppRoleAssignment",
-                            "displayName": entitlement["attributes"].get("displayName", "No displayName"),
-                            "appRole_description": entitlement["attributes"].get("appRole_description", "No description")
-                        })
-                    elif entitlement["attribute"] == "azureADEligibleRoles":
-                        parsed_entitlements.append({
-                            "attribute": "azureADEligibleRoles",
-                            "roleName": entitlement["attributes"]["roleName"]
-                        })
-                elif source_name == "Oracle | Multi Applications":
-                    if entitlement["attribute"] == "APP_ROLE_CODE":
-                        parsed_entitlements.append({
-                            "attribute": "APP_ROLE_CODE",
-                            "APP_ROLE_NAME": entitlement["attributes"]["APP_ROLE_NAME"]
-                        })
-                else:
-                    parsed_entitlements.append({
-                        "value": entitlement["value"],
-                        "description": entitlement.get("description", "no description")
-                    })
-            return parsed_entitlements
-        else:
-            logger.error(f"Failed to retrieve entitlements for account ID: {account_id}. Status code: {response.status_code}")
-            logger.error(f"Response content: {response.text}")
-            return []
+        entitlements = list(iter_entitlements(account_id, source_name))
     except requests.exceptions.RequestException as e:
         logger.error(f"Exception occurred while retrieving entitlements for account ID: {account_id}. Error: {e}")
         return []
+    # Failed lookups return early above, so only complete results are cached
+    response_cache.set('entitlements', account_id, entitlements)
+    return entitlements
+
+# Function to fetch one batch of roles with an "id in (...)" filter, paging through the results
+def get_roles_by_id_batch(role_ids):
+    quoted_role_ids = ", ".join(f"\"{role_id}\"" for role_id in role_ids)
+    try:
+        return list(client.paginate(f"{base_url}beta/roles", {"filters": f"id in ({quoted_role_ids})"}, endpoint='role_details_bulk'))
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Exception occurred while retrieving role batch starting with: {role_ids[0]}. Error: {e}")
+        return []
+
+# Function to fetch the details of every unique role up front, returning a read-only role ID -> details table
+def prefetch_role_details(role_ids, batch_size=role_batch_size, max_workers=max_workers):
+    unique_role_ids = list(dict.fromkeys(role_ids))
+    role_table = {}
+    uncached_role_ids = []
+    for role_id in unique_role_ids:
+        cached_role_details = response_cache.get('role_details', role_id)
+        if cached_role_details is not None:
+            role_table[role_id] = cached_role_details
+        else:
+            uncached_role_ids.append(role_id)
+
+    batches = [uncached_role_ids[i:i + batch_size] for i in range(0, len(uncached_role_ids), batch_size)]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for roles in executor.map(get_roles_by_id_batch, batches):
+            for role in roles:
+                role_table[role['id']] = parse_role_details(role)
+                response_cache.set('role_details', role['id'], role_table[role['id']])
+
+    # Any role the bulk query did not return (e.g. a failed batch) is fetched on its own
+    remaining_role_ids = [role_id for role_id in unique_role_ids if role_id not in role_table]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for role_id, role_details in zip(remaining_role_ids, executor.map(get_role_details, remaining_role_ids)):
+            role_table[role_id] = role_details
+
+    logger.info(f"Prefetched {len(unique_role_ids)} roles ({len(uncached_role_ids)} uncached) in {len(batches)} batches.")
+    return MappingProxyType(role_table)
+
+# Function to log whether an identity's department and team match the reorg.csv row
+def check_identity_attributes(row, identity):
+    payroll_id = row[0].strip()
+    current_department_id = row[3].strip()
+    current_team_id = row[5].strip()
+    identity_department_id = identity.department_id
+    identity_team_id = identity.team_id
+    if identity_department_id != current_department_id or identity_team_id != current_team_id:
+        logger.error(f"Mismatch for alias {payroll_id}: CSV departmentId={current_department_id}, API departmentId={identity_department_id}; CSV teamId={current_team_id}, API teamId={identity_team_id}")
+    else:
+        logger.info(f"Match for alias {payroll_id}: departmentId and teamId are correct.")
+
+# Function to hydrate a single reorg.csv row into an identity record with roles, accounts and entitlements
+def hydrate_identity(row, identity_map, role_assignments, account_executor):
+    payroll_id = row[0].strip()
+
+    # Identities were resolved into compact records in batches up front
+    identity = identity_map.get(payroll_id)
+    if not identity:
+        return None
+
+    identity_id = identity.id
+
+    # Stream accounts and fan out each account's entitlement lookup as soon as the account arrives
+    entitlement_futures = []
+    try:
+        for account in iter_accounts(identity_id):
+            entitlement_futures.append((account['sourceName'], account_executor.submit(get_entitlements, account['id'], account['sourceName'])))
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Exception occurred while retrieving accounts for identity ID: {identity_id}. Error: {e}")
+    accounts = [AccountRecord(source_name, future.result()) for source_name, future in entitlement_futures]
+
+    # Role assignments were prefetched for every identity before this phase; role details stay in the shared role table
+    record = identity.with_access(role_assignments.get(identity_id, []), accounts)
+    check_identity_attributes(row, record)
+    return record
+
+# Function to hydrate the pending rows with per-identity REST calls, returning the prefetched role table
+def hydrate_with_rest(pending_rows, checkpoint, max_workers=max_workers, dump_raw=dump_raw_identities):
+    # Resolve every payroll ID in batches so the per-row loop never makes a lookup call
+    identity_map, missing_aliases = resolve_identities_by_alias([row[0].strip() for row in pending_rows], max_workers=max_workers, dump_raw=dump_raw)
+    if missing_aliases:
+        print(f'No matching identity found for {len(missing_aliases)} payroll IDs: {", ".join(missing_aliases)}')
+
+    # Phase 1: gather every identity's role assignments, then fetch the unique roles in bulk
+    identity_ids = list(dict.fromkeys(identity.id for identity in identity_map.values()))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        role_assignments = dict(zip(identity_ids, executor.map(get_role_assignments, identity_ids)))
+    role_table = prefetch_role_details([role.id for roles in role_assignments.values() for role in roles], max_workers=max_workers)
+
+    # Function to hydrate a row and save it to the checkpoint log as soon as it is complete
+    def hydrate_and_checkpoint(row):
+        record = hydrate_identity(row, identity_map, role_assignments, account_executor)
+        if record:
+            checkpoint.append(row[0].strip(), record.to_dict(role_table))
+
+    # Phase 2: identities and accounts use separate pools so identity workers never wait on their own pool
+    logger.info(f"Hydrating {len(pending_rows)} rows with {max_workers} workers.")
+    with ThreadPoolExecutor(max_workers=max_workers) as identity_executor, ThreadPoolExecutor(max_workers=max_workers) as account_executor:
+        # Consume the results so any exception raised by a worker stops the run
+        for _ in identity_executor.map(hydrate_and_checkpoint, pending_rows):
+            pass
+    return role_table
+
+# Function to hydrate the pending rows from search identity documents, which already include roles, accounts and access
+def hydrate_with_search(pending_rows, checkpoint, max_workers=max_workers, dump_raw=dump_raw_identities):
+    rows_by_alias = {}
+    for row in pending_rows:
+        rows_by_alias.setdefault(row[0].strip(), []).append(row)
+    aliases = list(rows_by_alias)
+    batches = [aliases[i:i + search_batch_size] for i in range(0, len(aliases), search_batch_size)]
+    logger.info(f"Searching {len(aliases)} aliases in {len(batches)} batches.")
+
+    # Role details are fetched once per unique role, as the batches that need them arrive, into a table shared by every batch
+    role_table = {}
+    found_aliases = set()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for documents in executor.map(lambda batch: search_identity_batch(client, batch), batches):
+            # Map each document as its batch arrives so only the compact identity record is kept, not the raw document
+            records = {get_document_field(document, search_alias_field): map_identity_document(document, keep_raw=dump_raw) for document in documents}
+            new_role_ids = [role.id for record in records.values() for role in record.roles if role.id not in role_table]
+            if new_role_ids:
+                role_table.update(prefetch_role_details(new_role_ids, max_workers=max_workers))
+
+            # Each identity is saved to the checkpoint log as soon as its batch is complete
+            for alias, record in records.items():
+                if alias not in rows_by_alias:
+                    continue
+                found_aliases.add(alias)
+                for row in rows_by_alias[alias]:
+                    check_identity_attributes(row, record)
+                checkpoint.append(alias, record.to_dict(role_table))
+
+    missing_aliases = [alias for alias in aliases if alias not in found_aliases]
+    if missing_aliases:
+        logger.info(f"No matching identity found for aliases: {', '.join(missing_aliases)}")
+        print(f'No matching identity found for {len(missing_aliases)} payroll IDs: {", ".join(missing_aliases)}')
+    return MappingProxyType(role_table)
 
 # Function to process reorg.csv
-def process_reorg_csv():
-    identities = []
-    role_cache = {}
+def process_reorg_csv(max_workers=max_workers, use_cache=True, refresh_cache=False, resume=False, output_format=output_format, parquet=export_parquet, engine=hydration_engine, dump_raw=dump_raw_identities):
+    # Fail before any API work rather than after the whole hydration
+    if parquet and not parquet_supported:
+        raise ImportError("pyarrow is required for Parquet output.")
+    metrics.reset()
+    client.set_pool_size(max_workers * 2)
+    response_cache.enabled = use_cache
+    if refresh_cache:
+        response_cache.clear()
 
     with open('reorg.csv', mode='r') as file:
         csv_reader = csv.reader(file, delimiter=',')
         headers = next(csv_reader)  # Extract headers
         print(f'Column names are: {", ".join(headers)}')
-        
-        for row in csv_reader:
-            payroll_id = row[0].strip()
-            current_department_id = row[3].strip()
-            new_department_id = row[4].strip()
-            current_team_id = row[5].strip()
-            new_team_id = row[6].strip()
-
-            identity = get_identity_by_alias(payroll_id)
-            if identity:
-                identity_id = identity['id']
-                identity_department_id = identity['attributes'].get('departmentId')
-                identity_team_id = identity['attributes'].get('teamId')
-
-                # Fetch role assignments and add to identity details
-                roles = get_role_assignments(identity_id)
-                for role in roles:
-                    role_id = role['id']
-                    if role_id not in role_cache:
-                        role_cache[role_id] = get_role_details(role_id)
-                    role['details'] = role_cache[role_id]
-                identity['roles'] = roles
-
-                # Fetch accounts and entitlements
-                accounts = get_accounts(identity_id)
-                simplified_accounts = []
-                for account in accounts:
-                    account_id = account['id']
-                    source_name = account['sourceName']
-                    entitlements = get_entitlements(account_id, source_name)
-                    simplified_account = {
-                        "sourceName": source_name,
-                        "entitlements": entitlements
-                    }
-                    simplified_accounts.append(simplified_account)
-                identity['accounts'] = simplified_accounts
-
-                if identity_department_id != current_department_id or identity_team_id != current_team_id:
-                    logger.error(f"Mismatch for alias {payroll_id}: CSV departmentId={current_department_id}, API departmentId={identity_department_id}; CSV teamId={current_team_id}, API teamId={identity_team_id}")
-                else:
-                    logger.info(f"Match for alias {payroll_id}: departmentId and teamId are correct.")
-
-                identities.append(identity)
-
-    # Save all identities' details to a single file
-    with open('all_identities.json', 'w') as f:
-        json.dump(identities, f, indent=4)
-    
+        rows = list(csv_reader)
+    payroll_ids = [row[0].strip() for row in rows]
+
+    # Each hydrated identity is appended to the checkpoint log; on resume, completed payroll IDs are skipped
+    checkpoint = CheckpointLog(resume=resume)
+    pending_rows = [row for row in rows if not checkpoint.is_completed(row[0].strip())]
+    if resume:
+        print(f'Resuming: {len(rows) - len(pending_rows)} of {len(rows)} rows already completed.')
+
+    hydration_start = time.perf_counter()
+    try:
+        if engine == 'search':
+            role_table = hydrate_with_search(pending_rows, checkpoint, max_workers, dump_raw)
+        else:
+            role_table = hydrate_with_rest(pending_rows, checkpoint, max_workers, dump_raw)
+    finally:
+        checkpoint.close()
+    hydration_seconds = time.perf_counter() - hydration_start
+    # Only identities saved to the checkpoint log count; payroll IDs that did not resolve are left out
+    metrics.set_gauge('identities_hydrated', checkpoint.appended)
+    metrics.set_gauge('hydration_seconds', hydration_seconds)
+    metrics.set_gauge('identities_per_second', checkpoint.appended / hydration_seconds if hydration_seconds else 0.0)
+    response_cache.record_hit_ratios()
+    print(response_cache.summary())
+
+    # Roles of identities completed by an earlier run are filled in from the details saved in the checkpoint log
+    role_table = dict(role_table)
+
+    # Build the final output from the checkpoint log, in the order of the CSV rows
+    if output_format == 'ndjson':
+        # Write one identity per line and stream them back into the export, so only one identity is in memory at a time
+        with open('all_identities.ndjson', 'w') as f:
+            for identity in checkpoint.iter_identities(payroll_ids):
+                f.write(json.dumps(identity) + "\n")
+        identities = iter_identities('all_identities.ndjson')
+    else:
+        # Save all identities' details to a single file, one identity at a time, and keep only the compact records for the export
+        identities = []
+        with open('all_identities.json', 'w') as f:
+            f.write("[")
+            for identity in checkpoint.iter_identities(payroll_ids):
+                f.write(",\n    " if identities else "\n    ")
+                f.write(json.dumps(identity, indent=4).replace("\n", "\n    "))
+                identities.append(IdentityRecord.from_dict(identity, role_table))
+            f.write("\n]" if identities else "]")
+
     # Call the export function with the collected data
     logger.info("Starting export process...")
-    export_data(identities)
+    export_data(identities, parquet=parquet, role_table=role_table)
     logger.info("Export process completed.")
 
+    print(metrics.summary())
+    metrics.write(os.path.join(metrics_dir, 'run_metrics.json'), os.path.join(metrics_dir, 'run_metrics.prom'))
+    logger.info(f"Wrote run metrics to {metrics_dir}")
+
 if __name__ == "__main__":
-    process_reorg_csv()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Process reorg.csv and export identity reports.")
+    parser.add_argument('--workers', type=int, default=max_workers, help="Number of concurrent workers (default: MAX_WORKERS or 8)")
+    parser.add_argument('--no-cache', action='store_true', help="Bypass the persistent response cache for this run")
+    parser.add_argument('--refresh-cache', action='store_true', help="Invalidate the persistent response cache before running")
+    parser.add_argument('--resume', action='store_true', help="Skip payroll IDs already saved in the checkpoint log by an interrupted run")
+    parser.add_argument('--output-format', choices=['json', 'ndjson'], default=output_format, help="Format of the saved identities file (default: OUTPUT_FORMAT or json)")
+    parser.add_argument('--parquet', action='store_true', default=export_parquet, help="Also write each report as Parquet (requires pyarrow)")
+    parser.add_argument('--engine', choices=['rest', 'search'], default=hydration_engine, help="Hydration engine (default: HYDRATION_ENGINE or rest)")
+    parser.add_argument('--dump-raw', action='store_true', default=dump_raw_identities, help="Save the full identity payloads to the identities file instead of only the exported fields")
+    args = parser.parse_args()
+    if args.parquet and not parquet_supported:
+        parser.error("Parquet output (--parquet or EXPORT_PARQUET=true) requires pyarrow, which is not installed.")
+    process_reorg_csv(max_workers=args.workers, use_cache=not args.no_cache, refresh_cache=args.refresh_cache, resume=args.resume, output_format=args.output_format, parquet=args.parquet, engine=args.engine, dump_raw=args.dump_raw)
\ No newline at end of file
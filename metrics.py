@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+# Prefix for every exported metric name
+metric_prefix = "reorg_"
+# Upper bounds (seconds) of the latency histogram buckets
+default_buckets = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Class holding one latency histogram with cumulative-friendly bucket counts
+class Histogram:
+    def __init__(self, buckets=default_buckets):
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    # Function to record one observation
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.bucket_counts[i] += 1
+                break
+        else:
+            self.bucket_counts[-1] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    # Function to estimate a quantile as the upper bound of the bucket it falls in
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, bucket_count in zip(self.buckets, self.bucket_counts):
+            seen += bucket_count
+            if seen >= target:
+                return bound
+        return self.max
+
+    # Function to return the histogram as a plain dict
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "buckets": {str(bound): bucket_count for bound, bucket_count in zip(list(self.buckets) + ["+Inf"], self.bucket_counts)},
+        }
+
+# Class collecting counters, gauges and histograms, each keyed by name and labels
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    # Function to turn keyword labels into a hashable, ordered key
+    def key(self, name, labels):
+        return (name, tuple(sorted(labels.items())))
+
+    # Function to add to a counter
+    def increment(self, name, value=1, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    # Function to set a gauge
+    def set_gauge(self, name, value, **labels):
+        with self.lock:
+            self.gauges[self.key(name, labels)] = value
+
+    # Function to record an observation in a histogram
+    def observe(self, name, value, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    # Function to time a block of code into a histogram
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    # Function to read a counter, summing over every label set that matches the given labels
+    def counter_value(self, name, **labels):
+        with self.lock:
+            return sum(value for (counter_name, counter_labels), value in self.counters.items() if counter_name == name and set(labels.items()) <= set(counter_labels))
+
+    # Function to clear every metric, e.g. between runs in the same process
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.gauges = {}
+            self.histograms = {}
+
+    # Function to return every metric as a JSON-serialisable dict
+    def to_dict(self):
+        with self.lock:
+            return {
+                "counters": [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in sorted(self.counters.items())],
+                "gauges": [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in sorted(self.gauges.items())],
+                "histograms": [dict(histogram.to_dict(), name=name, labels=dict(labels)) for (name, labels), histogram in sorted(self.histograms.items())],
+            }
+
+    # Function to render every metric in the Prometheus text exposition format
+    def to_prometheus(self):
+        # Function to format a label set, optionally with an extra label such as le
+        def format_labels(labels, extra=None):
+            items = list(labels) + ([extra] if extra else [])
+            if not items:
+                return ""
+            escaped = [(name, str(value).replace("\\", "\\\\").replace("\"", "\\\"")) for name, value in items]
+            return "{" + ",".join(f"{name}=\"{value}\"" for name, value in escaped) + "}"
+
+        lines = []
+        with self.lock:
+            for metric_type, metrics in (("counter", self.counters), ("gauge", self.gauges)):
+                for name in sorted({name for name, _ in metrics}):
+                    lines.append(f"# TYPE {metric_prefix}{name} {metric_type}")
+                    for (metric_name, labels), value in sorted(metrics.items()):
+                        if metric_name == name:
+                            lines.append(f"{metric_prefix}{name}{format_labels(labels)} {value}")
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE {metric_prefix}{name} histogram")
+                for (metric_name, labels), histogram in sorted(self.histograms.items()):
+                    if metric_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, bucket_count in zip(list(histogram.buckets) + ["+Inf"], histogram.bucket_counts):
+                        cumulative += bucket_count
+                        lines.append(f"{metric_prefix}{name}_bucket{format_labels(labels, ('le', bound))} {cumulative}")
+                    lines.append(f"{metric_prefix}{name}_sum{format_labels(labels)} {histogram.sum}")
+                    lines.append(f"{metric_prefix}{name}_count{format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    # Function to write the metrics as JSON and as a Prometheus text file
+    def write(self, json_file, prometheus_file):
+        for path in (json_file, prometheus_file):
+            directory = os.path.dirname(path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+        with open(json_file, 'w') as f:
+            json.dump(self.to_dict(), f, indent=4)
+        with open(prometheus_file, 'w') as f:
+            f.write(self.to_prometheus())
+
+    # Function to build a human-readable run summary
+    def summary(self):
+        data = self.to_dict()
+        lines = ["Run summary:"]
+        requests_by_endpoint = {}
+        for counter in data["counters"]:
+            if counter["name"] == "api_requests_total":
+                endpoint = counter["labels"].get("endpoint", "other")
+                requests_by_endpoint[endpoint] = requests_by_endpoint.get(endpoint, 0) + counter["value"]
+        if data["histograms"]:
+            lines.append(f"  {'endpoint / stage':<30} {'calls':>8} {'mean s':>8} {'p95 s':>8} {'max s':>8} {'retries':>8} {'429s':>6}")
+        for histogram in data["histograms"]:
+            if histogram["name"] == "api_request_seconds":
+                endpoint = histogram["labels"].get("endpoint", "other")
+                retries = self.counter_value("api_retries_total", endpoint=endpoint)
+                throttled = self.counter_value("api_throttled_total", endpoint=endpoint)
+                lines.append(f"  {endpoint:<30} {requests_by_endpoint.get(endpoint, histogram['count']):>8} {histogram['mean']:>8.3f} {histogram['p95']:>8.2f} {histogram['max']:>8.2f} {retries:>8} {throttled:>6}")
+        for histogram in data["histograms"]:
+            if histogram["name"] != "api_request_seconds":
+                label = ", ".join(str(value) for value in histogram["labels"].values()) or histogram["name"]
+                lines.append(f"  {label:<30} {histogram['count']:>8} {histogram['mean']:>8.3f} {'':>8} {histogram['max']:>8.2f}")
+        for gauge in data["gauges"]:
+            labels = ", ".join(f"{name}={value}" for name, value in gauge["labels"].items())
+            value = gauge["value"]
+            formatted = f"{value:.3f}" if isinstance(value, float) else str(value)
+            lines.append(f"  {gauge['name']}{' (' + labels + ')' if labels else ''}: {formatted}")
+        return "\n".join(lines)
+
+# Shared registry used by every module in the run
+metrics = MetricsRegistry()
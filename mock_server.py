@@ -0,0 +1,308 @@
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Sources served by the mock tenant; "Workday" has no registered normalizer and exercises the default one
+sources = [
+    "Active Directory",
+    "Azure Active Directory",
+    "Oracle | Multi Applications",
+    "Oracle | Legacy Accounts",
+    "Workday",
+]
+
+# Class that generates a deterministic synthetic tenant; identities, accounts and entitlements are derived on demand
+class Fixtures:
+    def __init__(self, identity_count, seed=42, entitlements_per_source=500, heavy_account_rate=0.02):
+        self.identity_count = identity_count
+        self.seed = seed
+        self.entitlements_per_source = entitlements_per_source
+        self.heavy_account_rate = heavy_account_rate
+        self.entitlements = {source_name: [self.make_entitlement(source_name, j) for j in range(entitlements_per_source)] for source_name in sources}
+        # Roles grant a handful of entitlements each, referenced by the names the normalizers produce
+        rng = random.Random(seed)
+        self.roles = []
+        for r in range(max(10, identity_count // 20)):
+            granted = []
+            for _ in range(rng.randint(3, 8)):
+                source_name = rng.choice(sources)
+                granted.append(rng.choice(self.entitlements[source_name]))
+            self.roles.append({
+                "id": f"role{r:06d}",
+                "name": f"Role {r}",
+                "owner": {"name": f"Owner {r % 50}"},
+                "entitlements": [{"id": ent["id"], "name": ent["roleName"]} for ent in granted],
+            })
+
+    # Function to build one raw entitlement in the shape its source returns
+    def make_entitlement(self, source_name, j):
+        source_key = sources.index(source_name)
+        entitlement_id = f"ent{source_key}-{j:05d}"
+        if source_name == "Active Directory":
+            value = f"CN=Group {j},OU=Groups,DC=example,DC=com"
+            return {"id": entitlement_id, "name": f"Group {j}", "attribute": "memberOf", "value": value, "description": f"AD group {j}", "attributes": {}, "roleName": f"Group {j}"}
+        if source_name == "Azure Active Directory":
+            if j % 2:
+                return {"id": entitlement_id, "name": f"App Role {j}", "attribute": "appRoleAssignments", "value": f"approle-{j}", "attributes": {"displayName": f"App Role {j}", "appRole_description": f"Azure app role {j}"}, "roleName": f"App Role {j}"}
+            return {"id": entitlement_id, "name": f"Directory Role {j}", "attribute": "azureADEligibleRoles", "value": f"dirrole-{j}", "attributes": {"roleName": f"Directory Role {j}"}, "roleName": f"Directory Role {j}"}
+        if source_name == "Oracle | Multi Applications":
+            return {"id": entitlement_id, "name": f"APP{j}", "attribute": "APP_ROLE_CODE", "value": f"APP{j}", "attributes": {"APP_ROLE_NAME": f"Oracle App Role {j}"}, "roleName": f"Oracle App Role {j}"}
+        if source_name == "Oracle | Legacy Accounts":
+            return {"id": entitlement_id, "name": f"LEGACY_{j}", "attribute": "responsibility", "value": f"LEGACY_{j}", "description": f"Legacy responsibility {j}", "roleName": f"LEGACY_{j}"}
+        return {"id": entitlement_id, "name": f"Workday Group {j}", "attribute": "groups", "value": f"wd-{j}", "description": f"Workday group {j}", "roleName": f"Workday Group {j}"}
+
+    # Function to return the alias used for identity i
+    def alias(self, i):
+        return f"P{i:06d}"
+
+    # Function to parse the identity index back out of an alias or identity ID
+    def index_of(self, value, prefix):
+        if not value.startswith(prefix):
+            return None
+        try:
+            i = int(value[len(prefix):])
+        except ValueError:
+            return None
+        return i if 0 <= i < self.identity_count else None
+
+    # Function to build the beta/identities payload for identity i
+    def identity(self, i):
+        return {
+            "id": f"id{i:06d}",
+            "name": f"User {i}",
+            "alias": self.alias(i),
+            "attributes": {
+                "uid": self.alias(i),
+                "departmentId": f"D{i % 40}",
+                "teamId": f"T{i % 200}",
+                "email": f"user{i}@example.com",
+            },
+        }
+
+    # Function to return the roles assigned to identity i
+    def identity_roles(self, i):
+        rng = random.Random(self.seed * 1000003 + i)
+        return rng.sample(self.roles, rng.randint(1, min(4, len(self.roles))))
+
+    # Function to return the accounts of identity i
+    def identity_accounts(self, i):
+        rng = random.Random(self.seed * 2000003 + i)
+        return [
+            {"id": f"acct{i:06d}-{k}", "name": f"user{i}", "identityId": f"id{i:06d}", "sourceName": source_name, "source": {"name": source_name}}
+            for k, source_name in enumerate(rng.sample(sources, rng.randint(2, 4)))
+        ]
+
+    # Function to return the raw entitlements of an account
+    def account_entitlements(self, account_id):
+        match = re.fullmatch(r"acct(\d+)-(\d+)", account_id)
+        if not match:
+            return None
+        i, k = int(match.group(1)), int(match.group(2))
+        if i >= self.identity_count:
+            return None
+        accounts = self.identity_accounts(i)
+        if k >= len(accounts):
+            return None
+        source_name = accounts[k]["sourceName"]
+        rng = random.Random(self.seed * 3000003 + i * 10 + k)
+        # A few accounts are heavy, like large AD group memberships, so paging is exercised
+        count = rng.randint(300, self.entitlements_per_source) if rng.random() < self.heavy_account_rate else rng.randint(5, 30)
+        return [self.strip(entitlement) for entitlement in rng.sample(self.entitlements[source_name], count)]
+
+    # Function to drop the helper roleName field from raw entitlements
+    def strip(self, entitlement):
+        return {key: value for key, value in entitlement.items() if key != "roleName"}
+
+    # Function to build the search document for identity i, which includes roles, accounts and access
+    def search_document(self, i):
+        document = self.identity(i)
+        access = [{"type": "ROLE", "id": role["id"], "name": role["name"], "owner": role["owner"]} for role in self.identity_roles(i)]
+        accounts = self.identity_accounts(i)
+        for account in accounts:
+            for entitlement in self.account_entitlements(account["id"]):
+                access.append(dict(entitlement, type="ENTITLEMENT", displayName=entitlement["name"], source={"name": account["sourceName"]}))
+        document["access"] = access
+        document["accounts"] = [{"id": account["id"], "name": account["name"], "source": account["source"]} for account in accounts]
+        return document
+
+# Class implementing the mock IdentityNow HTTP API
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    # Silence the default per-request logging to stderr
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    # Function to send a JSON response
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Function to read the request body
+    def read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    # Function to return one page of a list, honouring limit/offset, the server page cap and count=true
+    def send_page(self, items, query):
+        config = self.server.config
+        limit = min(int(query.get("limit", ["250"])[0]), config.max_page)
+        offset = int(query.get("offset", ["0"])[0])
+        headers = {}
+        if config.total_count and query.get("count", ["false"])[0] == "true":
+            headers["X-Total-Count"] = str(len(items))
+        self.send_json(200, items[offset:offset + limit], headers)
+
+    # Function to route a request to its endpoint
+    def handle_request(self, method):
+        config = self.server.config
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        path = url.path.rstrip("/")
+        body = self.read_body()
+
+        if path == "/__stats":
+            self.send_json(200, self.server.stats.snapshot())
+            return
+        if path == "/__reset" and method == "POST":
+            self.server.stats.reset()
+            self.send_json(200, {})
+            return
+
+        endpoint = self.endpoint_name(method, path)
+        self.server.stats.record(endpoint)
+        if config.latency:
+            time.sleep(config.latency)
+        if endpoint != "oauth_token" and config.throttle_rate and random.random() < config.throttle_rate:
+            self.server.stats.record("throttled")
+            self.send_json(429, {"detailCode": "429 Too Many Requests"}, {"Retry-After": str(config.retry_after)})
+            return
+        if endpoint != "oauth_token" and not (self.headers.get("Authorization") or "").startswith("Bearer mock-token"):
+            self.send_json(401, {"detailCode": "401 Unauthorized"})
+            return
+
+        fixtures = self.server.fixtures
+        if endpoint == "oauth_token":
+            self.send_json(200, {"access_token": f"mock-token-{time.time()}", "token_type": "bearer", "expires_in": config.token_ttl})
+        elif endpoint == "identities":
+            aliases = re.findall(r'"([^"]+)"', query.get("filters", [""])[0])
+            indexes = sorted(i for i in (fixtures.index_of(alias, "P") for alias in aliases) if i is not None)
+            self.send_page([fixtures.identity(i) for i in indexes], query)
+        elif endpoint == "role_assignments":
+            i = fixtures.index_of(path.split("/")[3], "id")
+            if i is None:
+                self.send_json(404, {"detailCode": "404 Not found"})
+                return
+            self.send_page([{"role": {"id": role["id"], "name": role["name"], "owner": role["owner"]}} for role in fixtures.identity_roles(i)], query)
+        elif endpoint == "roles":
+            role_ids = set(re.findall(r'"([^"]+)"', query.get("filters", [""])[0]))
+            self.send_page([role for role in fixtures.roles if role["id"] in role_ids], query)
+        elif endpoint == "role":
+            role_id = path.split("/")[3]
+            role = next((role for role in fixtures.roles if role["id"] == role_id), None)
+            if role is None:
+                self.send_json(404, {"detailCode": "404 Not found"})
+            else:
+                self.send_json(200, role)
+        elif endpoint == "accounts":
+            identity_ids = re.findall(r'"([^"]+)"', query.get("filters", [""])[0])
+            i = fixtures.index_of(identity_ids[0], "id") if identity_ids else None
+            self.send_page(fixtures.identity_accounts(i) if i is not None else [], query)
+        elif endpoint == "account_entitlements":
+            entitlements = fixtures.account_entitlements(path.split("/")[3])
+            if entitlements is None:
+                self.send_json(404, {"detailCode": "404 Not found"})
+            else:
+                self.send_page(entitlements, query)
+        elif endpoint == "search":
+            request = json.loads(body or b"{}")
+            aliases = re.findall(r'"([^"]+)"', request.get("query", {}).get("query", ""))
+            indexes = sorted(i for i in (fixtures.index_of(alias, "P") for alias in aliases) if i is not None)
+            search_after = (request.get("searchAfter") or [None])[0]
+            if search_after:
+                indexes = [i for i in indexes if f"id{i:06d}" > search_after]
+            limit = min(int(query.get("limit", ["250"])[0]), config.max_page)
+            self.send_json(200, [fixtures.search_document(i) for i in indexes[:limit]])
+        else:
+            self.send_json(404, {"detailCode": "404 Not found"})
+
+    # Function to name the endpoint a request path belongs to, used for the request counters
+    def endpoint_name(self, method, path):
+        parts = path.strip("/").split("/")
+        if method == "POST" and parts == ["oauth", "token"]:
+            return "oauth_token"
+        if method == "POST" and parts == ["v3", "search"]:
+            return "search"
+        if parts[:2] == ["beta", "identities"]:
+            return "role_assignments" if len(parts) == 4 and parts[3] == "role-assignments" else "identities"
+        if parts[:2] == ["beta", "roles"]:
+            return "role" if len(parts) == 3 else "roles"
+        if parts[:2] == ["beta", "accounts"]:
+            return "account_entitlements" if len(parts) == 4 and parts[3] == "entitlements" else "accounts"
+        return "unknown"
+
+# Class for the threaded mock server; clients dropping keep-alive connections are not errors
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass
+
+# Class counting the requests served per endpoint
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+
+    def record(self, endpoint):
+        with self.lock:
+            self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counts)
+
+    def reset(self):
+        with self.lock:
+            self.counts = {}
+
+# Function to create (but not start) a mock server
+def create_server(port, identity_count, latency=0.0, max_page=250, throttle_rate=0.0, retry_after=1, token_ttl=750, seed=42, total_count=True):
+    server = MockServer(("127.0.0.1", port), MockHandler)
+    server.config = argparse.Namespace(latency=latency, max_page=max_page, throttle_rate=throttle_rate, retry_after=retry_after, token_ttl=token_ttl, total_count=total_count)
+    server.fixtures = Fixtures(identity_count, seed=seed)
+    server.stats = Stats()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a local mock IdentityNow tenant from generated fixtures.")
+    parser.add_argument('--port', type=int, default=8800, help="Port to listen on (default: 8800)")
+    parser.add_argument('--identities', type=int, default=1000, help="Number of synthetic identities (default: 1000)")
+    parser.add_argument('--latency', type=float, default=0.0, help="Added latency per request in seconds (default: 0)")
+    parser.add_argument('--max-page', type=int, default=250, help="Largest page the server returns, regardless of limit (default: 250)")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="Fraction of API requests answered with 429 (default: 0)")
+    parser.add_argument('--retry-after', type=int, default=1, help="Retry-After seconds sent with injected 429s (default: 1)")
+    parser.add_argument('--token-ttl', type=int, default=750, help="expires_in seconds for issued tokens (default: 750)")
+    parser.add_argument('--seed', type=int, default=42, help="Fixture seed (default: 42)")
+    parser.add_argument('--no-total-count', action='store_true', help="Never send X-Total-Count, even when count=true is requested")
+    args = parser.parse_args()
+    server = create_server(args.port, args.identities, args.latency, args.max_page, args.throttle_rate, args.retry_after, args.token_ttl, args.seed, not args.no_total_count)
+    print(f"Mock IdentityNow tenant with {args.identities} identities listening on http://127.0.0.1:{server.server_address[1]}/", flush=True)
+    server.serve_forever()
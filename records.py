@@ -0,0 +1,157 @@
+import sys
+import threading
+from entitlements import make_entitlement, upgrade_saved_entitlement
+
+# Function to intern a repeated string so every record shares one copy; other values are returned unchanged
+def intern_string(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+# Class holding one canonical entitlement record
+class Entitlement:
+    __slots__ = ("name", "value", "description", "attribute")
+
+    def __init__(self, name, value, description, attribute):
+        self.name = intern_string(name)
+        self.value = intern_string(value)
+        self.description = intern_string(description)
+        self.attribute = intern_string(attribute)
+
+    # Function to return the entitlement in the shape produced by the normalizers
+    def to_dict(self):
+        return make_entitlement(self.name, self.value, self.description, self.attribute)
+
+# Class storing each distinct entitlement once; accounts refer to entitlements by their ID in the table
+class EntitlementTable:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = {}
+        self.entitlements = []
+
+    # Function to add a normalized entitlement, returning the ID of the existing entry if it was already seen
+    def add(self, entitlement):
+        key = (entitlement["name"], entitlement.get("value"), entitlement.get("description"), entitlement.get("attribute"))
+        with self.lock:
+            entitlement_id = self.ids.get(key)
+            if entitlement_id is None:
+                entitlement_id = len(self.entitlements)
+                self.entitlements.append(Entitlement(*key))
+                self.ids[key] = entitlement_id
+        return entitlement_id
+
+    # Function to look up an entitlement by ID
+    def get(self, entitlement_id):
+        return self.entitlements[entitlement_id]
+
+    def __len__(self):
+        return len(self.entitlements)
+
+# Shared table used by every identity in the run
+entitlement_table = EntitlementTable()
+
+# Class holding a role assignment; the role's details live once in the role table, keyed by ID
+class RoleRef:
+    __slots__ = ("id", "name", "owner")
+
+    def __init__(self, id, name, owner="N/A"):
+        self.id = id
+        self.name = intern_string(name)
+        self.owner = intern_string(owner)
+
+    # Function to return the role with its details from the role table
+    def to_dict(self, role_table=None):
+        return {
+            "name": self.name,
+            "owner": self.owner,
+            "id": self.id,
+            "details": (role_table or {}).get(self.id, {})
+        }
+
+# Class holding one account's source and the IDs of its entitlements in the entitlement table
+class AccountRecord:
+    __slots__ = ("source_name", "entitlement_ids")
+
+    def __init__(self, source_name, entitlements=()):
+        self.source_name = intern_string(source_name)
+        self.entitlement_ids = tuple(entitlement_table.add(entitlement) for entitlement in entitlements)
+
+    # Function to resolve the account's entitlements from the entitlement table
+    @property
+    def entitlements(self):
+        return [entitlement_table.get(entitlement_id) for entitlement_id in self.entitlement_ids]
+
+    # Function to return the account in the shape saved to the identities file
+    def to_dict(self):
+        return {
+            "sourceName": self.source_name,
+            "entitlements": [entitlement.to_dict() for entitlement in self.entitlements]
+        }
+
+# Class holding only the identity fields that validation and export use
+# The full API payload is kept in raw only when raw payloads are dumped
+class IdentityRecord:
+    __slots__ = ("id", "name", "alias", "department_id", "team_id", "roles", "accounts", "raw")
+
+    def __init__(self, id, name, alias, department_id=None, team_id=None, roles=(), accounts=(), raw=None):
+        self.id = id
+        self.name = name
+        self.alias = alias
+        self.department_id = intern_string(department_id)
+        self.team_id = intern_string(team_id)
+        self.roles = tuple(roles)
+        self.accounts = tuple(accounts)
+        self.raw = raw
+
+    # Function to project an identity payload (from beta/identities or a search document) into a record
+    @classmethod
+    def from_payload(cls, identity, roles=(), accounts=(), keep_raw=False):
+        attributes = identity.get("attributes") or {}
+        return cls(
+            identity["id"],
+            identity.get("name"),
+            identity.get("alias"),
+            attributes.get("departmentId"),
+            attributes.get("teamId"),
+            roles,
+            accounts,
+            identity if keep_raw else None
+        )
+
+    # Function to return a copy of the record with its roles and accounts, leaving the resolved record shared by repeated rows untouched
+    def with_access(self, roles, accounts):
+        return IdentityRecord(self.id, self.name, self.alias, self.department_id, self.team_id, roles, accounts, self.raw)
+
+    # Function to build a record from an identity saved by to_dict, or by earlier versions that saved the full payload
+    # Entitlements saved in the shapes used before normalization are upgraded through the normalizer registry
+    # Role details saved on each role are added to role_table, when given, for roles it does not have yet
+    @classmethod
+    def from_dict(cls, identity, role_table=None):
+        roles = []
+        for role in identity.get("roles") or []:
+            role_id = role.get("id", role["name"])
+            roles.append(RoleRef(role_id, role["name"], role.get("owner", "N/A")))
+            if role_table is not None and role.get("details") and role_id not in role_table:
+                role_table[role_id] = role["details"]
+        accounts = []
+        for account in identity.get("accounts") or []:
+            source_name = account.get("sourceName")
+            entitlements = (upgrade_saved_entitlement(source_name, entitlement) for entitlement in account.get("entitlements") or [])
+            accounts.append(AccountRecord(source_name, [entitlement for entitlement in entitlements if entitlement is not None]))
+        return cls.from_payload(identity, roles, accounts)
+
+    # Function to return the identity as saved to the checkpoint log and identities file
+    # With a raw payload, the full payload is returned with the roles and accounts added, as earlier versions saved it
+    def to_dict(self, role_table=None):
+        if self.raw is not None:
+            identity = dict(self.raw)
+            # Search documents may carry the alias only in an attribute
+            identity.setdefault("alias", self.alias)
+        else:
+            identity = {
+                "id": self.id,
+                "name": self.name,
+                "alias": self.alias,
+                "attributes": {"departmentId": self.department_id, "teamId": self.team_id}
+            }
+        identity["roles"] = [role.to_dict(role_table) for role in self.roles]
+        identity["accounts"] = [account.to_dict() for account in self.accounts]
+        return identity
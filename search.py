@@ -0,0 +1,98 @@
+import os
+import logging
+import requests
+from dotenv import load_dotenv
+from entitlements import normalize_entitlement
+from records import IdentityRecord, RoleRef, AccountRecord
+
+# Function to set up logging
+def setup_logging():
+    if not os.path.exists('logs'):
+        os.makedirs('logs')
+    logger = logging.getLogger('search')
+    logger.setLevel(logging.INFO)
+    handler = logging.FileHandler('logs/search.log')
+    formatter = logging.Formatter('%(asctime)s - %(message)s')
+    handler.setFormatter(formatter)
+    logger.addHandler(handler)
+    return logger
+
+# Set up logging
+logger = setup_logging()
+logger.info("Logging setup complete.")
+
+# Load environment variables from a .env file, or from the file named by ENV_FILE
+load_dotenv(os.getenv('ENV_FILE'), override=True)
+base_url = os.getenv('BASE_URL')
+search_url = f"{base_url}v3/search"
+# Number of aliases per search query, the identity document field that holds the alias, and the search page size
+search_batch_size = int(os.getenv('SEARCH_BATCH_SIZE', '250'))
+search_alias_field = os.getenv('SEARCH_ALIAS_FIELD', 'attributes.uid')
+search_page_size = 250
+
+# Function to read a dotted field such as "attributes.uid" from a search document
+def get_document_field(document, field):
+    value = document
+    for part in field.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+# Function to stream the identity documents for a batch of aliases, paging with searchAfter cursors
+def iter_identity_documents(client, aliases, page_size=search_page_size):
+    quoted_aliases = " OR ".join(f"\"{alias}\"" for alias in aliases)
+    body = {
+        "indices": ["identities"],
+        "query": {"query": f"{search_alias_field}:({quoted_aliases})"},
+        # A stable sort is required for searchAfter paging
+        "sort": ["id"],
+        # Only the fields the reorg needs are returned
+        "queryResultFilter": {"includes": ["id", "name", "alias", "attributes", "access", "accounts"]},
+    }
+    # Each alias matches at most one identity
+    found = 0
+    while True:
+        response = client.post(search_url, params={"limit": page_size}, json=body, endpoint='search')
+        if response.status_code != 200:
+            logger.error(f"Failed to search identities for alias batch starting with: {aliases[0]}. Status code: {response.status_code}")
+            logger.error(f"Response content: {response.text}")
+            raise requests.exceptions.HTTPError(f"Status code {response.status_code} for {search_url}", response=response)
+        page = response.json()
+        yield from page
+        found += len(page)
+        # The tenant may return smaller pages than asked for, so only an empty page or a match for every alias ends the batch
+        if not page or found >= len(aliases):
+            return
+        body["searchAfter"] = [page[-1]["id"]]
+
+# Function to search the identity documents for a batch of aliases, returning an empty list if the search fails
+def search_identity_batch(client, aliases):
+    try:
+        return list(iter_identity_documents(client, aliases))
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Exception occurred while searching identities for alias batch starting with: {aliases[0]}. Error: {e}")
+        return []
+
+# Function to map a search identity document into a compact identity record
+# Role details are not copied onto the roles; the caller reads them from the prefetched role table
+def map_identity_document(document, keep_raw=False):
+    access = document.get("access") or []
+    roles = [RoleRef(item["id"], item["name"], (item.get("owner") or {}).get("name", "N/A")) for item in access if item.get("type") == "ROLE"]
+
+    # Search documents don't say which account holds an entitlement, so entitlements are grouped per source
+    entitlements_by_source = {}
+    for account in document.get("accounts") or []:
+        entitlements_by_source.setdefault((account.get("source") or {}).get("name"), [])
+    for item in access:
+        if item.get("type") != "ENTITLEMENT":
+            continue
+        source_name = (item.get("source") or {}).get("name")
+        normalized_entitlement = normalize_entitlement(source_name, item)
+        if normalized_entitlement is not None:
+            entitlements_by_source.setdefault(source_name, []).append(normalized_entitlement)
+    accounts = [AccountRecord(source_name, entitlements) for source_name, entitlements in entitlements_by_source.items()]
+
+    record = IdentityRecord.from_payload(document, roles, accounts, keep_raw=keep_raw)
+    record.alias = record.alias or get_document_field(document, search_alias_field)
+    return record
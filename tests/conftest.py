@@ -0,0 +1,37 @@
+import os
+import sys
+import tempfile
+import threading
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_server import create_server
+
+# The modules create logs/ (and the pipeline reports/) in the working directory, so tests run in a scratch directory
+os.chdir(tempfile.mkdtemp(prefix='reorg-tests-'))
+
+# One mock tenant serves every test; the modules read BASE_URL when they are imported, so it starts first
+mock_tenant = create_server(0, identity_count=20)
+threading.Thread(target=mock_tenant.serve_forever, daemon=True).start()
+
+# The settings are forced, and an empty ENV_FILE replaces .env, so a real .env can never point a test at a live tenant
+env_file = os.path.abspath('test.env')
+open(env_file, 'w').close()
+os.environ.update({
+    'ENV_FILE': env_file,
+    'CLIENT_ID': 'test',
+    'CLIENT_SECRET': 'test',
+    'CERT_PATH': 'unused-cert.pem',
+    'BASE_URL': f"http://127.0.0.1:{mock_tenant.server_address[1]}/",
+    'TOKEN_CACHE_FILE': '',
+    'RATE_LIMIT': '1000',
+})
+
+# Fixture returning the mock tenant; any change a test makes to its config is undone afterwards
+@pytest.fixture
+def tenant():
+    defaults = dict(vars(mock_tenant.config))
+    yield mock_tenant
+    vars(mock_tenant.config).update(defaults)
+    mock_tenant.stats.reset()
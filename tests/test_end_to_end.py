@@ -0,0 +1,62 @@
+import csv
+import json
+import os
+import pytest
+
+import main
+
+# Function to write a synthetic reorg.csv covering every identity of the mock tenant
+def write_reorg_csv(tenant):
+    with open('reorg.csv', 'w') as f:
+        f.write("payrollID,firstName,lastName,currentDepartmentID,newDepartment ID,currentTeamID,newTeamID,locationID\n")
+        for i in range(tenant.fixtures.identity_count):
+            f.write(f"{tenant.fixtures.alias(i)},First{i},Last{i},D{i % 40},D{(i + 1) % 40},T{i % 200},T{(i + 7) % 200},L{i % 5}\n")
+
+# Function to run the whole pipeline in a working directory of its own
+def run_reorg(run_dir, tenant, **kwargs):
+    os.makedirs(run_dir, exist_ok=True)
+    os.chdir(run_dir)
+    if not os.path.exists('reorg.csv'):
+        write_reorg_csv(tenant)
+    main.process_reorg_csv(max_workers=4, use_cache=False, output_format='json', **kwargs)
+
+# Function to read the entitlements report rows, in a stable order
+def read_entitlement_rows():
+    with open('reports/all_identities_entitlements.csv', newline='') as f:
+        return sorted(csv.reader(f))
+
+# Small pages and some 429s, so paging, retries and the rate limiter are all exercised
+@pytest.fixture
+def capped_tenant(tenant, monkeypatch):
+    tenant.config.max_page = 7
+    tenant.config.throttle_rate = 0.05
+    tenant.config.retry_after = 0
+    monkeypatch.chdir(os.getcwd())
+    return tenant
+
+def test_rest_and_search_engines_export_the_same_entitlements(capped_tenant, tmp_path):
+    run_reorg(tmp_path / 'rest', capped_tenant, engine='rest')
+    rest_rows = read_entitlement_rows()
+    run_reorg(tmp_path / 'search', capped_tenant, engine='search')
+    search_rows = read_entitlement_rows()
+    assert len(rest_rows) > capped_tenant.fixtures.identity_count
+    assert rest_rows == search_rows
+
+def test_resume_after_a_truncated_checkpoint_gives_the_same_identities(capped_tenant, tmp_path):
+    run_reorg(tmp_path, capped_tenant, engine='rest')
+    with open('all_identities.json') as f:
+        complete_identities = json.load(f)
+    assert len(complete_identities) == capped_tenant.fixtures.identity_count
+
+    # Keep the first few records and half of the next one, as a crash mid-write would
+    checkpoint_file = 'checkpoints/reorg_checkpoint.ndjson'
+    with open(checkpoint_file, 'rb') as f:
+        lines = f.readlines()
+    with open(checkpoint_file, 'wb') as f:
+        f.writelines(lines[:8])
+        f.write(lines[8][:len(lines[8]) // 2])
+    os.remove('all_identities.json')
+
+    run_reorg(tmp_path, capped_tenant, engine='rest', resume=True)
+    with open('all_identities.json') as f:
+        assert json.load(f) == complete_identities
@@ -0,0 +1,16 @@
+import os
+import pytest
+
+import export
+from export import ReportWriter, entitlements_header
+
+def test_missing_pyarrow_leaves_existing_report_untouched(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(export, 'parquet_supported', False)
+    os.makedirs('reports')
+    with open('reports/all_identities_entitlements.csv', 'w') as f:
+        f.write("previous report\n")
+    with pytest.raises(ImportError):
+        ReportWriter("all_identities_entitlements", entitlements_header, parquet=True)
+    with open('reports/all_identities_entitlements.csv') as f:
+        assert f.read() == "previous report\n"
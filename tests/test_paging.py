@@ -0,0 +1,33 @@
+import pytest
+
+from api_connection import ApiClient, base_url, page_size
+
+# Function to find an account whose entitlements span several pages of the given size
+def find_account(tenant, min_records):
+    for i in range(tenant.fixtures.identity_count):
+        for account in tenant.fixtures.identity_accounts(i):
+            entitlements = tenant.fixtures.account_entitlements(account["id"])
+            if len(entitlements) >= min_records:
+                return account["id"], entitlements
+    raise AssertionError(f"No mock account has {min_records} entitlements.")
+
+@pytest.mark.parametrize("total_count", [True, False])
+def test_paginate_returns_every_record_when_pages_are_capped(tenant, total_count):
+    tenant.config.max_page = 7
+    tenant.config.total_count = total_count
+    assert tenant.config.max_page < page_size
+    client = ApiClient(pool_size=2)
+    account_id, entitlements = find_account(tenant, 3 * tenant.config.max_page + 1)
+    records = list(client.paginate(f"{base_url}beta/accounts/{account_id}/entitlements"))
+    assert [record["id"] for record in records] == [entitlement["id"] for entitlement in entitlements]
+
+@pytest.mark.parametrize("total_count", [True, False])
+def test_paginate_handles_a_total_that_is_a_multiple_of_the_page_cap(tenant, total_count):
+    tenant.config.max_page = 5
+    tenant.config.total_count = total_count
+    client = ApiClient(pool_size=2)
+    aliases = [tenant.fixtures.alias(i) for i in range(20)]
+    quoted_aliases = ", ".join(f"\"{alias}\"" for alias in aliases)
+    records = list(client.paginate(f"{base_url}beta/identities", {"filters": f"alias in ({quoted_aliases})"}))
+    assert [record["alias"] for record in records] == aliases
+
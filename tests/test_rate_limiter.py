@@ -0,0 +1,39 @@
+import time
+import threading
+import unittest
+
+from api_connection import RateLimiter
+
+# Function to call acquire in a thread, returning whether it finished within the timeout
+def acquire_within(rate_limiter, timeout):
+    thread = threading.Thread(target=rate_limiter.acquire, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    return not thread.is_alive()
+
+class RateLimiterTest(unittest.TestCase):
+    def test_acquire_after_throttle_driven_slowdown(self):
+        rate_limiter = RateLimiter(10)
+        for _ in range(5):
+            rate_limiter.on_throttled(0)
+        self.assertEqual(rate_limiter.rate, 0.5)
+        # At 0.5 requests/second the next token is due after 2 seconds
+        start = time.monotonic()
+        self.assertTrue(acquire_within(rate_limiter, 5))
+        self.assertGreaterEqual(time.monotonic() - start, 1.5)
+
+    def test_rate_below_one_request_per_second(self):
+        rate_limiter = RateLimiter(0.5)
+        self.assertTrue(acquire_within(rate_limiter, 1))
+        self.assertTrue(acquire_within(rate_limiter, 5))
+
+    def test_rate_recovers_after_successes(self):
+        rate_limiter = RateLimiter(10)
+        rate_limiter.on_throttled(0)
+        self.assertEqual(rate_limiter.rate, 5)
+        for _ in range(100):
+            rate_limiter.on_success()
+        self.assertEqual(rate_limiter.rate, 10)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,19 @@
+from api_connection import ApiClient, page_size
+from search import iter_identity_documents
+
+def test_search_returns_every_document_when_pages_are_capped(tenant):
+    tenant.config.max_page = 7
+    assert tenant.config.max_page < page_size
+    client = ApiClient(pool_size=2)
+    aliases = [tenant.fixtures.alias(i) for i in range(20)]
+    documents = list(iter_identity_documents(client, aliases))
+    assert [document["alias"] for document in documents] == aliases
+
+def test_search_stops_on_an_empty_page_when_aliases_are_missing(tenant):
+    tenant.config.max_page = 7
+    client = ApiClient(pool_size=2)
+    # Aliases without an identity mean the batch can never match every alias, so only an empty page ends it
+    aliases = [tenant.fixtures.alias(i) for i in range(14)] + ["P999998", "P999999"]
+    documents = list(iter_identity_documents(client, aliases))
+    assert [document["alias"] for document in documents] == aliases[:14]
+    assert tenant.stats.snapshot()["search"] == 3
@@ -0,0 +1,24 @@
+import unittest
+from unittest import mock
+
+import api_connection
+from api_connection import TokenProvider
+
+class TokenProviderTest(unittest.TestCase):
+    def test_token_without_expires_in_is_reused(self):
+        with mock.patch.object(api_connection, 'request_access_token', return_value={'access_token': 'token'}) as request_access_token:
+            token_provider = TokenProvider(cache_file=None)
+            for _ in range(3):
+                self.assertEqual(token_provider.get_token(), 'token')
+        self.assertEqual(request_access_token.call_count, 1)
+
+    def test_invalidated_token_is_refreshed(self):
+        responses = [{'access_token': 'first', 'expires_in': 749}, {'access_token': 'second', 'expires_in': 749}]
+        with mock.patch.object(api_connection, 'request_access_token', side_effect=responses):
+            token_provider = TokenProvider(cache_file=None)
+            self.assertEqual(token_provider.get_token(), 'first')
+            token_provider.invalidate('first')
+            self.assertEqual(token_provider.get_token(), 'second')
+
+if __name__ == "__main__":
+    unittest.main()